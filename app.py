@@ -2,17 +2,43 @@
 # Imports
 #----------------------------------------------------------------------------#
 
+import os
 import sys
 import json
+import hashlib
+import threading
+import time
+from datetime import datetime
+from functools import lru_cache, wraps
+from itertools import groupby
 import dateutil.parser
 import babel
-from flask import Flask, render_template, request, Response, flash, redirect, url_for
+import babel.dates
+import click
+from flask import Flask, render_template, request, Response, flash, redirect, url_for, abort, stream_with_context, session, jsonify, g
+from flask.cli import AppGroup
+from jinja2 import FileSystemBytecodeCache
 from flask_moment import Moment
-from flask_sqlalchemy import SQLAlchemy
+from markupsafe import Markup
+from sqlalchemy import func, cast, select
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.orm import joinedload, selectinload, noload
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from werkzeug.http import is_resource_modified
 import logging
 from logging import Formatter, FileHandler
 from flask_wtf import Form, CsrfProtect
 from forms import *
+from search import search_criteria, index_matches
+from search_index import InvertedIndex, tokenize
+from pagination import SortKey, InvalidCursor, paginate, paginate_ids
+from importer import BulkImport, read_rows, batches
+from exporter import CONTENT_TYPES, export_chunks
+from replicas import RoutingSQLAlchemy, ReplicaRouter
+from instrumentation import SQLInstrumentation, current_stats
+import metrics
+from profiling import RequestProfiler
+from cache import ResponseCache, TaggedCache, FragmentCacheExtension
 from flask_migrate import Migrate
 #----------------------------------------------------------------------------#
 # App Config.
@@ -21,7 +47,24 @@ from flask_migrate import Migrate
 app = Flask(__name__)
 moment = Moment(app)
 app.config.from_object('config')
-db = SQLAlchemy(app)
+if not app.config['SECRET_KEY']:
+  raise RuntimeError('FYYUR_SECRET_KEY is not set; every worker needs the same key '
+                     'to read the session cookies the others sign.')
+db = RoutingSQLAlchemy(app)
+replicas = ReplicaRouter(app, db)
+sql_instrumentation = SQLInstrumentation(app)
+metrics.init_app(app, current_stats)
+profiler = RequestProfiler(app)
+# Profiled requests always run the view, so the profile shows its work.
+response_cache = ResponseCache(app, bypass=lambda: 'profiler' in g)
+# {% cache %} blocks in templates share the response cache's backend.
+app.jinja_env.add_extension(FragmentCacheExtension)
+if app.config['FRAGMENT_CACHE']:
+  app.jinja_env.fragment_cache = TaggedCache(response_cache.backend)
+# Compiled templates outlive the worker; see `flask templates precompile`.
+if app.config['TEMPLATE_CACHE_DIR']:
+  os.makedirs(app.config['TEMPLATE_CACHE_DIR'], exist_ok=True)
+  app.jinja_env.bytecode_cache = FileSystemBytecodeCache(app.config['TEMPLATE_CACHE_DIR'])
 migrate = Migrate(app, db)
 csrf = CsrfProtect(app)
 csrf.init_app(app) # Fixing the bug of csrf token not found
@@ -32,8 +75,39 @@ csrf.init_app(app) # Fixing the bug of csrf token not found
 # Models.
 #----------------------------------------------------------------------------#
 
+class Genre(db.Model):
+    __tablename__ = 'Genre'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(120), nullable=False, unique=True)
+
+    def __repr__(self):
+        return f"<Genre id={self.id} name={self.name}>"
+
+# Genre first in the primary keys, so filtering by genre is an index range
+# scan; the extra index serves loading one venue's or artist's genres.
+venue_genres = db.Table('VenueGenre',
+    db.Column('genre_id', db.Integer, db.ForeignKey('Genre.id'), primary_key=True),
+    db.Column('venue_id', db.Integer, db.ForeignKey('Venue.id', ondelete='CASCADE'), primary_key=True),
+    db.Index('ix_VenueGenre_venue_id', 'venue_id')
+)
+
+artist_genres = db.Table('ArtistGenre',
+    db.Column('genre_id', db.Integer, db.ForeignKey('Genre.id'), primary_key=True),
+    db.Column('artist_id', db.Integer, db.ForeignKey('Artist.id', ondelete='CASCADE'), primary_key=True),
+    db.Index('ix_ArtistGenre_artist_id', 'artist_id')
+)
+
 class Venue(db.Model):
     __tablename__ = 'Venue'
+    __table_args__ = (
+        db.Index('ix_Venue_state_city_name_id', 'state', 'city', 'name', 'id'),
+        db.Index('ix_Venue_name_id', 'name', 'id'),
+        db.Index('ix_Venue_created_at_id', 'created_at', 'id'),
+        db.Index('ix_Venue_search_vector', 'search_vector', postgresql_using='gin'),
+        # The pg_trgm indexes on name, city and state (Artist's too) are left
+        # to migration 8b2e4d6f1a3c, which skips them without the extension.
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String)
@@ -47,7 +121,16 @@ class Venue(db.Model):
     seeking_talent = db.Column(db.Boolean, nullable=False, default=False)
     seeking_description = db.Column(db.String(500))
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
-    shows = db.relationship("Show", backref="Venue", lazy=False, cascade="all, delete-orphan")
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow,
+                           server_default=db.func.now(), nullable=False)
+    # Denormalized show counts, see count_show() and refresh_show_counts().
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # Maintained by a database trigger (see the search_vector migration).
+    search_vector = db.deferred(db.Column(TSVECTOR().with_variant(db.Text(), 'sqlite')))
+    # Loaded lazily by default; each route picks the strategy it needs.
+    genres = db.relationship("Genre", secondary=venue_genres, order_by="Genre.name")
+    shows = db.relationship("Show", backref="venue", cascade="all, delete-orphan")
 
     def __repr__(self):
         return f"<Venue id={self.id} name={self.name} city={self.city} state={self.city}>\n"
@@ -56,30 +139,57 @@ class Venue(db.Model):
 
 class Artist(db.Model):
     __tablename__ = 'Artist'
+    __table_args__ = (
+        db.Index('ix_Artist_name_id', 'name', 'id'),
+        db.Index('ix_Artist_created_at_id', 'created_at', 'id'),
+        db.Index('ix_Artist_search_vector', 'search_vector', postgresql_using='gin'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String)
     city = db.Column(db.String(120))
     state = db.Column(db.String(120))
     phone = db.Column(db.String(120))
-    genres = db.Column(db.String(120))
     image_link = db.Column(db.String(500))
     facebook_link = db.Column(db.String(120))
     website = db.Column(db.String(120))
     seeking_talent = db.Column(db.Boolean, nullable=False, default=False)
     seeking_description = db.Column(db.String(500))
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
-    shows = db.relationship("Show", backref="Artist", lazy=False, cascade="all, delete-orphan")
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow,
+                           server_default=db.func.now(), nullable=False)
+    # Denormalized show counts, see count_show() and refresh_show_counts().
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # Maintained by a database trigger (see the search_vector migration).
+    search_vector = db.deferred(db.Column(TSVECTOR().with_variant(db.Text(), 'sqlite')))
+    genres = db.relationship("Genre", secondary=artist_genres, order_by="Genre.name")
+    shows = db.relationship("Show", backref="artist", cascade="all, delete-orphan")
 
     # TODO: implement any missing fields, as a database migration using Flask-Migrate
 
 class Show(db.Model):
     __tablename__ = "Show"
-    
+    __table_args__ = (
+        db.Index('ix_Show_venue_id_start_time', 'venue_id', 'start_time'),
+        db.Index('ix_Show_artist_id_start_time', 'artist_id', 'start_time'),
+        db.Index('ix_Show_start_time_id', 'start_time', 'id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     artist_id = db.Column(db.Integer, db.ForeignKey("Artist.id"), nullable=False)
     venue_id = db.Column(db.Integer, db.ForeignKey("Venue.id"), nullable=False)
     start_time = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow,
+                           server_default=db.func.now(), nullable=False)
+
+class ShowCounterRoll(db.Model):
+    # A single row: shows that started up to rolled_until have been moved to
+    # the past counts by `flask show-counters roll`.
+    __tablename__ = 'ShowCounterRoll'
+
+    id = db.Column(db.Integer, primary_key=True)
+    rolled_until = db.Column(db.DateTime, nullable=False)
 
 # TODO Implement Show and Artist models, and complete all model relationships and properties, as a database migration.
 
@@ -87,15 +197,701 @@ class Show(db.Model):
 # Filters.
 #----------------------------------------------------------------------------#
 
-def format_datetime(value, format='medium'):
-  date = dateutil.parser.parse(value)
-  if format == 'full':
-      format="EEEE MMMM, d, y 'at' h:mma"
-  elif format == 'medium':
-      format="EE MM, dd, y h:mma"
-  return babel.dates.format_datetime(date, format, locale='en')
+DATETIME_FORMATS = {
+  'full': "EEEE MMMM, d, y 'at' h:mma",
+  'medium': "EE MM, dd, y h:mma",
+}
+
+@lru_cache(maxsize=64)
+def datetime_formatter(format, locale):
+  # A function formatting a datetime with format, one of DATETIME_FORMATS,
+  # babel's 'long' or 'short', or a pattern; the pattern is parsed and the
+  # locale loaded once per (format, locale).
+  format = DATETIME_FORMATS.get(format, format)
+  if format in ('long', 'short'):
+    return lambda value: babel.dates.format_datetime(value, format, locale=locale)
+  pattern = babel.dates.parse_pattern(format)
+  locale = babel.Locale.parse(locale)
+  def formatter(value):
+    # Naive values are taken as UTC, as babel.dates.format_datetime does.
+    if value.tzinfo is None:
+      value = value.replace(tzinfo=babel.dates.UTC)
+    return pattern.apply(value, locale)
+  return formatter
+
+def format_datetime(value, format='medium', locale='en'):
+  # Datetimes are formatted as they are; strings are parsed first.
+  if not isinstance(value, datetime):
+    value = dateutil.parser.parse(value)
+  return datetime_formatter(format, locale)(value)
+
+def format_datetimes(values, format='medium', locale='en'):
+  # format_datetime over a list, formatting each distinct value once:
+  # {% for when in shows|map(attribute='start_time')|datetimes('full') %}
+  formatter = datetime_formatter(format, locale)
+  formatted = {}
+  result = []
+  for value in values:
+    if value not in formatted:
+      date = value if isinstance(value, datetime) else dateutil.parser.parse(value)
+      formatted[value] = formatter(date)
+    result.append(formatted[value])
+  return result
 
 app.jinja_env.filters['datetime'] = format_datetime
+app.jinja_env.filters['datetimes'] = format_datetimes
+
+#----------------------------------------------------------------------------#
+# Show counters.
+#----------------------------------------------------------------------------#
+
+# Venue and Artist carry upcoming_shows_count/past_shows_count so listings
+# read one column instead of aggregating shows. Writes keep them current,
+# and `flask show-counters roll` (run periodically, e.g. from cron) moves
+# shows that have started since from the upcoming to the past count. It
+# carries on from where its last run stopped (ShowCounterRoll), so a late
+# or skipped run loses nothing.
+
+def count_show(show, delta=1):
+  # Adds (or with delta=-1 removes) show to its venue's and artist's
+  # counters, in the caller's transaction.
+  column = 'upcoming_shows_count' if show.start_time > datetime.now() else 'past_shows_count'
+  for model, owner_id in ((Venue, show.venue_id), (Artist, show.artist_id)):
+    counter = getattr(model, column)
+    model.query.filter(model.id == owner_id) \
+      .update({counter: counter + delta}, synchronize_session=False)
+
+def refresh_show_counts(model, ids=None):
+  # Recounts the counters of model rows (all of them when ids is None)
+  # with correlated subqueries, in a single UPDATE.
+  foreign_key = Show.venue_id if model is Venue else Show.artist_id
+  now = datetime.now()
+  upcoming = select(func.count(Show.id)) \
+    .where(foreign_key == model.id, Show.start_time > now).scalar_subquery()
+  past = select(func.count(Show.id)) \
+    .where(foreign_key == model.id, Show.start_time <= now).scalar_subquery()
+
+  query = model.query
+  if ids is not None:
+    query = query.filter(model.id.in_(ids))
+  return query.update({
+    model.upcoming_shows_count: upcoming,
+    model.past_shows_count: past
+  }, synchronize_session=False)
+
+def roll_show_counts(since, until):
+  # Refreshes the entities with shows that started after since and by
+  # until, the only ones whose counters can have gone stale.
+  started = db.session.query(Show.venue_id, Show.artist_id) \
+    .filter(Show.start_time > since, Show.start_time <= until) \
+    .all()
+  venue_ids = {show.venue_id for show in started}
+  artist_ids = {show.artist_id for show in started}
+  if venue_ids:
+    refresh_show_counts(Venue, venue_ids)
+  if artist_ids:
+    refresh_show_counts(Artist, artist_ids)
+  return len(venue_ids), len(artist_ids)
+
+show_counters_cli = AppGroup('show-counters', help='Maintain the denormalized show counters.')
+
+def rolled_until():
+  # The roll mark, locked until the transaction ends so that overlapping
+  # runs take turns; None before the first run.
+  return ShowCounterRoll.query.filter_by(id=1).with_for_update().one_or_none()
+
+def mark_rolled(mark, until):
+  if mark is None:
+    db.session.add(ShowCounterRoll(id=1, rolled_until=until))
+  else:
+    mark.rolled_until = until
+
+@show_counters_cli.command('roll')
+def roll_show_counts_command():
+  """Move shows that have started from the upcoming to the past counts."""
+  mark, until = rolled_until(), datetime.now()
+  if mark is None:
+    # Nothing records how current the counters are; recount them all.
+    venues, artists = refresh_show_counts(Venue), refresh_show_counts(Artist)
+  else:
+    venues, artists = roll_show_counts(mark.rolled_until, until)
+  mark_rolled(mark, until)
+  db.session.commit()
+  click.echo(f'Refreshed {venues} venues and {artists} artists')
+
+@show_counters_cli.command('rebuild')
+def rebuild_show_counts_command():
+  """Recount the show counters of every venue and artist."""
+  mark, until = rolled_until(), datetime.now()
+  venues = refresh_show_counts(Venue)
+  artists = refresh_show_counts(Artist)
+  mark_rolled(mark, until)
+  db.session.commit()
+  click.echo(f'Refreshed {venues} venues and {artists} artists')
+
+app.cli.add_command(show_counters_cli)
+
+#----------------------------------------------------------------------------#
+# Query helpers.
+#----------------------------------------------------------------------------#
+
+def genres_named(names):
+  # Genre rows for names, creating the ones that do not exist yet.
+  names = list(dict.fromkeys(names))
+  existing = {genre.name: genre for genre in Genre.query.filter(Genre.name.in_(names))}
+  return [existing.get(name) or Genre(name=name) for name in names]
+
+def with_genres(query, model):
+  # Narrows query to model rows having every ?genre= given. Each test is an
+  # EXISTS served by the (genre_id, owner_id) primary key of the
+  # association table.
+  for name in request.args.getlist('genre'):
+    query = query.filter(model.genres.any(Genre.name == name))
+  return query
+
+def show_partition(shows, upcoming, limit=None, total=0):
+  # Upcoming shows soonest first, or past shows most recent first, capped
+  # at limit rows, and the size of the whole partition. A partition that
+  # fits under the limit is counted exactly; a larger one reports total,
+  # the owner's show counter, so the query never reads past the limit.
+  now = datetime.now()
+  query = shows
+  if upcoming:
+    query = query.filter(Show.start_time > now) \
+                 .order_by(Show.start_time, Show.id)
+  else:
+    query = query.filter(Show.start_time <= now) \
+                 .order_by(Show.start_time.desc(), Show.id.desc())
+  if limit is not None:
+    query = query.limit(limit)
+
+  rows = query.all()
+  if limit is None or len(rows) < limit:
+    return rows, len(rows)
+  return rows, max(total, len(rows))
+
+def show_tile(row):
+  tile = row._asdict()
+  # The latest change to the show or the artist or venue it lists; keys
+  # the tile's cached fragment.
+  tile['version'] = max(tile.pop(key) for key in ('updated_at', 'artist_updated_at', 'venue_updated_at')
+                        if key in tile).isoformat()
+  return tile
+
+#----------------------------------------------------------------------------#
+# Pagination.
+#----------------------------------------------------------------------------#
+
+# Sort orders offered by the listing pages, each backed by an index of the
+# same columns. Result rows must expose every key by name.
+VENUE_SORTS = {
+  'area': [SortKey('state', Venue.state, False), SortKey('city', Venue.city, False),
+           SortKey('name', Venue.name, False), SortKey('id', Venue.id, False)],
+  'name': [SortKey('name', Venue.name, False), SortKey('id', Venue.id, False)],
+  'created_at': [SortKey('created_at', Venue.created_at, True), SortKey('id', Venue.id, True)],
+}
+
+ARTIST_SORTS = {
+  'name': [SortKey('name', Artist.name, False), SortKey('id', Artist.id, False)],
+  'created_at': [SortKey('created_at', Artist.created_at, True), SortKey('id', Artist.id, True)],
+}
+
+SHOW_SORTS = {
+  'start_time': [SortKey('start_time', Show.start_time, False), SortKey('id', Show.id, False)],
+}
+
+def search_sorts(model, rank):
+  # 'relevance' falls back to name order when the backend cannot rank.
+  by_name = [SortKey('name', model.name, False), SortKey('id', model.id, False)]
+  if rank is None:
+    return {'relevance': by_name, 'name': by_name}
+  return {'relevance': [SortKey('rank', rank, True)] + by_name, 'name': by_name}
+
+def page_size():
+  per_page = request.values.get('per_page', app.config['PAGE_SIZE'], type=int)
+  return max(1, min(per_page, app.config['MAX_PAGE_SIZE']))
+
+def paginated(query, sorts, default, stream=False):
+  sort = request.values.get('sort', default)
+  if sort not in sorts:
+    abort(400)
+
+  try:
+    return paginate(query, sorts[sort], request.values.get('cursor'), page_size(), stream)
+  except InvalidCursor:
+    abort(400)
+
+def search_page(model, search_term, *columns):
+  # (page, match count) of a venue or artist search. With the in-process
+  # index, relevance order and no genre filter, the matches are counted and
+  # paged here in id order and only the page's rows are read; otherwise the
+  # search runs in SQL.
+  backend = app.config['SEARCH_BACKEND']
+  index = get_search_index() if backend == 'index' else None
+  if index is not None and request.values.get('sort', 'relevance') == 'relevance' \
+      and not request.args.getlist('genre'):
+    ids = index_matches(index, model, search_term)
+    if ids is not None:
+      try:
+        page = paginate_ids(ids, request.values.get('cursor'), page_size())
+      except InvalidCursor:
+        abort(400)
+      if page.items:
+        page.items = db.session.query(*columns).filter(model.id.in_(page.items)).order_by(model.id).all()
+      return page, len(ids)
+
+  criterion, rank = search_criteria(db.session, model, search_term, backend, index=index)
+  if rank is not None:
+    rank = cast(rank, db.Float).label('rank')
+  query = db.session.query(*columns, *([rank] if rank is not None else [])).filter(criterion)
+  page = paginated(with_genres(query, model), search_sorts(model, rank), 'relevance')
+  count = with_genres(db.session.query(func.count(model.id)).filter(criterion), model).scalar()
+  return page, count
+
+@app.template_global()
+def page_url(cursor):
+  # Link to another page of the current listing, keeping its other options
+  # (including a search term that arrived in a POSTed form).
+  args = request.args.to_dict()
+  args.update((key, value) for key, value in request.form.items() if key != 'csrf_token')
+  args['cursor'] = cursor
+  return url_for(request.endpoint, **args)
+
+#----------------------------------------------------------------------------#
+# Streamed rendering.
+#----------------------------------------------------------------------------#
+
+# Ends the layout header of a streamed page (see layouts/main.html); an
+# undefined variable, and so nothing, when the page is not streamed.
+STREAM_FLUSH = Markup('<!-- flush -->')
+
+def streaming():
+  # A streamed response sends its headers, session cookie included, before
+  # the layout pops the flashed messages, so pages with pending flashes are
+  # rendered whole; so are profiled pages, to profile the rendering too.
+  return app.config['STREAM_LISTINGS'] and not session.get('_flashes') and 'profiler' not in g
+
+def flushed(chunks, size=8192):
+  # Jinja yields many small strings; send them in chunks of about size
+  # characters, and everything up to STREAM_FLUSH right away.
+  pending, length = [], 0
+  for chunk in chunks:
+    if chunk == STREAM_FLUSH:
+      if pending:
+        yield ''.join(pending)
+      pending, length = [], 0
+      continue
+    pending.append(chunk)
+    length += len(chunk)
+    if length >= size:
+      yield ''.join(pending)
+      pending, length = [], 0
+  if pending:
+    yield ''.join(pending)
+
+def render_listing(template_name, **context):
+  if not streaming():
+    return render_template(template_name, **context)
+  template = app.jinja_env.get_template(template_name)
+  app.update_template_context(context)
+  context['stream_flush'] = STREAM_FLUSH
+  return Response(stream_with_context(flushed(template.generate(context))))
+
+#----------------------------------------------------------------------------#
+# Conditional requests.
+#----------------------------------------------------------------------------#
+
+# A venue or artist page shows the entity, its shows and the artists or
+# venues playing them, split into upcoming and past at the time of the
+# request. Its validator is read from the entity's own row: updated_at,
+# which the show counters bump whenever shows are added or deleted (they
+# are the entity's own columns), and the counters themselves. Two index
+# probes on Show add the show that started last and the one that starts
+# next, so the page changes the moment a show starts even before the
+# counters are rolled. Genres, and the names and images of the artists or
+# venues on the page, are bumped through the entity, see the edit routes.
+
+def page_validator(model, entity_id):
+  # (etag, last modified) for the page of one venue or artist, without
+  # aggregating over its shows; None when there is no such entity.
+  owner_key = Show.venue_id if model is Venue else Show.artist_id
+  now = datetime.now()
+  last_started = select(func.max(Show.start_time)) \
+    .where(owner_key == model.id, Show.start_time <= now).scalar_subquery()
+  next_start = select(func.min(Show.start_time)) \
+    .where(owner_key == model.id, Show.start_time > now).scalar_subquery()
+  row = db.session.query(
+    model.updated_at,
+    model.upcoming_shows_count,
+    model.past_shows_count,
+    last_started,
+    next_start
+  ).filter(model.id == entity_id).first()
+  if row is None:
+    return None
+
+  updated_at, upcoming, past, last_started, next_start = row
+  # Start times are local, updated_at UTC.
+  last_modified = updated_at
+  if last_started is not None:
+    last_modified = max(last_modified, last_started + (datetime.utcnow() - now))
+  digest = hashlib.sha1(f'{model.__name__}:{entity_id}:{updated_at.isoformat()}:'
+                        f'{upcoming}:{past}:{next_start}'.encode('utf-8')).hexdigest()
+  return digest[:20], last_modified
+
+def touch_pages_showing(model, entity_id):
+  # Bumps updated_at of the artists (for a venue) or venues (for an artist)
+  # whose pages list shows with this entity's name and image, in the
+  # caller's transaction. Edits are rare next to page views.
+  if model is Venue:
+    owner_key, other, other_key = Show.venue_id, Artist, Show.artist_id
+  else:
+    owner_key, other, other_key = Show.artist_id, Venue, Show.venue_id
+  other.query.filter(other.id.in_(select(other_key).where(owner_key == entity_id))) \
+    .update({other.updated_at: datetime.utcnow()}, synchronize_session=False)
+
+def conditional(model):
+  # Answers conditional GETs of a venue or artist page with 304 Not Modified
+  # before the view loads or renders anything. Pages with flashed messages
+  # differ per user, so they are neither validated nor matched.
+  def decorator(view):
+    @wraps(view)
+    def conditional_view(**kwargs):
+      if session.get('_flashes'):
+        return view(**kwargs)
+
+      validator = page_validator(model, *kwargs.values())
+      if validator is None:
+        abort(404)
+      etag, last_modified = validator
+      if not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        response = Response(status=304)
+      else:
+        response = app.make_response(view(**kwargs))
+      response.set_etag(etag)
+      response.last_modified = last_modified
+      # Stored copies are revalidated on every use, which is cheap.
+      response.cache_control.no_cache = True
+      return response
+    return conditional_view
+  return decorator
+
+#----------------------------------------------------------------------------#
+# Connection pools.
+#----------------------------------------------------------------------------#
+
+def pool_status(engine):
+  # Checked-out connections against what the pool can lend before requests
+  # start to wait; saturation near 1 means DB_POOL_SIZE/DB_MAX_OVERFLOW are
+  # too small for the traffic (or connections are being held too long).
+  pool = engine.pool
+  if not isinstance(pool, QueuePool):
+    return {'pool': type(pool).__name__}
+
+  capacity = pool.size() + max(pool._max_overflow, 0)
+  return {
+    'pool': type(pool).__name__,
+    'size': pool.size(),
+    'max_overflow': pool._max_overflow,
+    'checked_in': pool.checkedin(),
+    'checked_out': pool.checkedout(),
+    'overflow': max(pool.overflow(), 0),
+    'saturation': round(pool.checkedout() / capacity, 3) if capacity else None,
+  }
+
+#----------------------------------------------------------------------------#
+# Search index.
+#----------------------------------------------------------------------------#
+
+# In-process index used when SEARCH_BACKEND is 'index'. The snapshot is
+# mapped at import time so workers forked from a preloaded app share it, and
+# mapped again whenever `flask search-index build` replaces it; each worker
+# applies its own writes on top, and sees the other workers' once a new
+# snapshot has been built.
+search_index = None
+search_index_stamp = None
+search_index_lock = threading.Lock()
+
+def document_terms(entity, genres):
+  return tokenize(entity.name, entity.city, entity.state, *genres)
+
+def build_search_index():
+  index = InvertedIndex()
+  for model, association, foreign_key in (
+    (Venue, venue_genres, venue_genres.c.venue_id),
+    (Artist, artist_genres, artist_genres.c.artist_id)
+  ):
+    genres = {}
+    for owner_id, name in db.session.query(foreign_key, Genre.name) \
+        .join(Genre, Genre.id == association.c.genre_id):
+      genres.setdefault(owner_id, []).append(name)
+
+    for row in db.session.query(model.id, model.name, model.city, model.state).yield_per(1000):
+      index.add(model.__tablename__, row.id, document_terms(row, genres.get(row.id, ())))
+  return index
+
+def snapshot_stamp(path):
+  # (inode, mtime) of the snapshot, or None when there is none. A new
+  # snapshot is renamed into place, so either tells it apart.
+  try:
+    stat = os.stat(path)
+  except FileNotFoundError:
+    return None
+  return stat.st_ino, stat.st_mtime_ns
+
+def get_search_index():
+  # Without a snapshot the index is built from the database on first use.
+  global search_index, search_index_stamp
+  stamp = snapshot_stamp(app.config['SEARCH_INDEX_PATH'])
+  if search_index is not None and stamp == search_index_stamp:
+    return search_index
+
+  with search_index_lock:
+    if stamp is not None and stamp != search_index_stamp:
+      index = InvertedIndex.load(app.config['SEARCH_INDEX_PATH'])
+      if search_index is not None:
+        # The snapshot's mtime is when its data was read, see below.
+        index.carry_over(search_index, stamp[1] / 1e9)
+      search_index, search_index_stamp = index, stamp
+    elif search_index is None:
+      search_index = build_search_index()
+  return search_index
+
+if app.config['SEARCH_BACKEND'] == 'index' and os.path.exists(app.config['SEARCH_INDEX_PATH']):
+  get_search_index()
+
+def index_document(kind, doc_id, terms):
+  if app.config['SEARCH_BACKEND'] == 'index':
+    get_search_index().add(kind, doc_id, terms)
+
+def unindex_document(kind, doc_id):
+  if app.config['SEARCH_BACKEND'] == 'index':
+    get_search_index().remove(kind, doc_id)
+
+search_index_cli = AppGroup('search-index', help='Manage the in-process search index.')
+
+@search_index_cli.command('build')
+def build_search_index_command():
+  """Write a fresh search index snapshot from the database."""
+  path = app.config['SEARCH_INDEX_PATH']
+  started = time.time()
+  build_search_index().save(path)
+  # Dated when the database was read, so workers reloading it keep their
+  # writes from after that.
+  os.utime(path, (started, started))
+  click.echo(f'Search index written to {path}')
+
+app.cli.add_command(search_index_cli)
+
+#----------------------------------------------------------------------------#
+# Bulk import.
+#----------------------------------------------------------------------------#
+
+def venue_import_values(form):
+  return dict(
+    name = form.name.data,
+    city = form.city.data,
+    state = form.state.data,
+    address = form.address.data,
+    phone = form.phone.data,
+    image_link = form.image_link.data,
+    facebook_link = form.facebook_link.data,
+    website = form.website_link.data,
+    seeking_talent = form.seeking_talent.data,
+    seeking_description = form.seeking_description.data
+  )
+
+def artist_import_values(form):
+  return dict(
+    name = form.name.data,
+    city = form.city.data,
+    state = form.state.data,
+    phone = form.phone.data,
+    image_link = form.image_link.data,
+    facebook_link = form.facebook_link.data,
+    website = form.website_link.data,
+    seeking_talent = form.seeking_venue.data,
+    seeking_description = form.seeking_description.data
+  )
+
+def show_import_values(form):
+  try:
+    artist_id, venue_id = int(form.artist_id.data), int(form.venue_id.data)
+  except (TypeError, ValueError):
+    raise ValueError('artist_id and venue_id must be integers')
+  return dict(artist_id = artist_id, venue_id = venue_id, start_time = form.start_time.data)
+
+def index_imported(kind, association, owner_key):
+  # After each batch of venues or artists, add them to the in-process
+  # search index with the genres just linked.
+  def after_batch(rows, ids):
+    if app.config['SEARCH_BACKEND'] != 'index':
+      return
+    genres = {}
+    for owner_id, name in db.session.query(association.c[owner_key], Genre.name) \
+        .join(Genre, Genre.id == association.c.genre_id) \
+        .filter(association.c[owner_key].in_(ids)):
+      genres.setdefault(owner_id, []).append(name)
+    for owner_id, values in zip(ids, rows):
+      index_document(kind, owner_id, tokenize(values['name'], values['city'], values['state'],
+                                              *genres.get(owner_id, ())))
+  return after_batch
+
+def count_imported_shows(rows, ids):
+  # Imported shows are counted by recounting their venues and artists, so
+  # re-running an import cannot count a show twice.
+  refresh_show_counts(Venue, {row['venue_id'] for row in rows})
+  refresh_show_counts(Artist, {row['artist_id'] for row in rows})
+
+def import_kinds():
+  return {
+    'venues': dict(model=Venue, form_class=VenueForm, values=venue_import_values,
+                   association=venue_genres, owner_key='venue_id', genres_named=genres_named,
+                   after_batch=index_imported('Venue', venue_genres, 'venue_id')),
+    'artists': dict(model=Artist, form_class=ArtistForm, values=artist_import_values,
+                    association=artist_genres, owner_key='artist_id', genres_named=genres_named,
+                    after_batch=index_imported('Artist', artist_genres, 'artist_id')),
+    'shows': dict(model=Show, form_class=ShowForm, values=show_import_values,
+                  after_batch=count_imported_shows),
+  }
+
+@app.cli.command('import')
+@click.argument('kind', type=click.Choice(['venues', 'artists', 'shows']))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'file_format', type=click.Choice(['csv', 'ndjson']),
+              help='Defaults to the file extension.')
+@click.option('--batch-size', default=1000, show_default=True,
+              help='Rows written per statement and transaction.')
+@click.option('--rejects', type=click.Path(dir_okay=False),
+              help='Where to write rejected rows (default: PATH.rejects.ndjson).')
+@click.option('--copy/--no-copy', 'use_copy', default=True, show_default=True,
+              help='Load shows with COPY on PostgreSQL.')
+def import_command(kind, path, file_format, batch_size, rejects, use_copy):
+  """Load venues, artists or shows from a CSV or NDJSON file."""
+  if file_format is None:
+    file_format = 'csv' if path.lower().endswith('.csv') else 'ndjson'
+  rejects = rejects or f'{path}.rejects.ndjson'
+
+  loader = BulkImport(db.session, use_copy=use_copy, **import_kinds()[kind])
+
+  def progress(loader):
+    click.echo(f'{loader.read} read, {loader.loaded} loaded, {loader.rejected} rejected')
+
+  with open(path, newline='', encoding='utf-8') as source, \
+       open(rejects, 'w', encoding='utf-8') as rejected:
+    loader.run(read_rows(source, file_format), batch_size, rejected, progress)
+  loader.finish()
+
+  if loader.rejected:
+    click.echo(f'Rejected rows written to {rejects}')
+  else:
+    os.remove(rejects)
+
+#----------------------------------------------------------------------------#
+# Export.
+#----------------------------------------------------------------------------#
+
+# Columns are named after the form fields so exports load back with
+# `flask import`.
+EXPORT_COLUMNS = {
+  'venues': ['id', 'name', 'city', 'state', 'address', 'phone', 'image_link', 'facebook_link',
+             'website_link', 'seeking_talent', 'seeking_description', 'genres'],
+  'artists': ['id', 'name', 'city', 'state', 'phone', 'image_link', 'facebook_link',
+              'website_link', 'seeking_venue', 'seeking_description', 'genres'],
+  'shows': ['id', 'artist_id', 'venue_id', 'start_time'],
+}
+
+EXPORT_BATCH_SIZE = 1000
+
+def export_query(kind):
+  if kind == 'venues':
+    return db.session.query(
+      Venue.id, Venue.name, Venue.city, Venue.state, Venue.address, Venue.phone,
+      Venue.image_link, Venue.facebook_link, Venue.website.label('website_link'),
+      Venue.seeking_talent, Venue.seeking_description
+    ).order_by(Venue.id)
+  if kind == 'artists':
+    return db.session.query(
+      Artist.id, Artist.name, Artist.city, Artist.state, Artist.phone,
+      Artist.image_link, Artist.facebook_link, Artist.website.label('website_link'),
+      Artist.seeking_talent.label('seeking_venue'), Artist.seeking_description
+    ).order_by(Artist.id)
+  return db.session.query(Show.id, Show.artist_id, Show.venue_id, Show.start_time) \
+    .order_by(Show.id)
+
+def export_rows(kind):
+  # Streams rows through a server-side cursor (yield_per sets
+  # stream_results), looking up the genres of each batch as it passes.
+  association, owner_key = {
+    'venues': (venue_genres, 'venue_id'),
+    'artists': (artist_genres, 'artist_id'),
+  }.get(kind, (None, None))
+
+  rows = export_query(kind).yield_per(EXPORT_BATCH_SIZE)
+  for batch in batches(rows, EXPORT_BATCH_SIZE):
+    genres = {}
+    if association is not None:
+      owner = association.c[owner_key]
+      for owner_id, name in db.session.query(owner, Genre.name) \
+          .join(Genre, Genre.id == association.c.genre_id) \
+          .filter(owner.in_([row.id for row in batch])) \
+          .order_by(owner, Genre.name):
+        genres.setdefault(owner_id, []).append(name)
+
+    for row in batch:
+      values = row._asdict()
+      if association is not None:
+        values['genres'] = genres.get(row.id, [])
+      yield values
+
+@app.cli.command('export')
+@click.argument('kind', type=click.Choice(['venues', 'artists', 'shows']))
+@click.argument('path', type=click.Path(dir_okay=False, allow_dash=True))
+@click.option('--format', 'file_format', type=click.Choice(['csv', 'ndjson']),
+              help='Defaults to the file extension (ignoring .gz).')
+@click.option('--gzip/--no-gzip', 'compress', default=None,
+              help='Compress the output; defaults to on for a .gz PATH.')
+def export_command(kind, path, file_format, compress):
+  """Write all venues, artists or shows to a CSV or NDJSON file ("-" for stdout)."""
+  name = path.lower()
+  if compress is None:
+    compress = name.endswith('.gz')
+  if name.endswith('.gz'):
+    name = name[:-len('.gz')]
+  if file_format is None:
+    file_format = 'csv' if name.endswith('.csv') else 'ndjson'
+
+  chunks = export_chunks(EXPORT_COLUMNS[kind], export_rows(kind), file_format, compress)
+  with click.open_file(path, 'wb') as target:
+    for chunk in chunks:
+      target.write(chunk)
+
+#----------------------------------------------------------------------------#
+# Templates.
+#----------------------------------------------------------------------------#
+
+def load_templates():
+  # Compiles (or loads from the bytecode cache) every template, keeping
+  # them in the environment's cache; returns how many there are.
+  names = app.jinja_env.list_templates(extensions=['html'])
+  for name in names:
+    app.jinja_env.get_template(name)
+  return len(names)
+
+templates_cli = AppGroup('templates', help='Manage the compiled template cache.')
+
+@templates_cli.command('precompile')
+def precompile_templates_command():
+  """Compile every template into TEMPLATE_CACHE_DIR."""
+  if app.jinja_env.bytecode_cache is None:
+    raise click.ClickException('TEMPLATE_CACHE_DIR is not set.')
+  # Compiled code depends on the filters and extensions of this release as
+  # well as on the sources, so start from an empty cache.
+  app.jinja_env.bytecode_cache.clear()
+  app.jinja_env.cache.clear()
+  click.echo(f'Compiled {load_templates()} templates into {app.config["TEMPLATE_CACHE_DIR"]}')
+
+app.cli.add_command(templates_cli)
 
 #----------------------------------------------------------------------------#
 # Controllers.
@@ -110,60 +906,57 @@ def index():
 #  ----------------------------------------------------------------
 
 @app.route('/venues')
+@response_cache.cached('venues')
+@replicas.read_only
 def venues():
 
-  data = []
-
-  results = Venue.query.distinct(Venue.city, Venue.state).all()
-
-  for result in results:
-    city_state_unit = {
-      "city": result.city,
-      "state": result.state
-    }
-
-    venues = Venue.query.filter_by(city=result.city, state=result.state).all()
-
-    #format each venue
-    formatted_venues = []
-    for venue in venues:
-      formatted_venues.append({
-        "id": venue.id,
-        "name": venue.name,
-        "num_upcoming_shows": len(list(filter(lambda x: x.start_time > datetime.now(), venue.shows)))
-      })
+  # One grouped query for the whole directory: areas, venues and their
+  # upcoming show counts all come back in a single round trip.
+  query = db.session.query(
+    Venue.city,
+    Venue.state,
+    Venue.id,
+    Venue.name,
+    Venue.created_at,
+    Venue.upcoming_shows_count
+  )
+  page = paginated(with_genres(query, Venue), VENUE_SORTS, 'area', stream=streaming())
+
+  # Built while the template iterates, so a streamed page renders each area
+  # as its rows arrive.
+  data = ({
+    "city": city,
+    "state": state,
+    "venues": [{
+      "id": venue.id,
+      "name": venue.name,
+      "num_upcoming_shows": venue.upcoming_shows_count
+    } for venue in venues]
+  } for (city, state), venues in groupby(page, key=lambda row: (row.city, row.state)))
 
-    city_state_unit["venues"] = formatted_venues
-    data.append(city_state_unit)
-  
-  return render_template('pages/venues.html', areas=data);
-  
-  # TODO: replace with real venues data.
-  # num_upcoming_shows should be aggregated based on number of upcoming shows per venue.
-  #return render_template('pages/venues.html', areas=data);
+  return render_listing('pages/venues.html', areas=data, page=page)
 
-@app.route('/venues/search', methods=['POST'])
+@app.route('/venues/search', methods=['GET', 'POST'])
+@replicas.read_only
 def search_venues():
-  search_term  = request.form.get('search_term', '')
+  search_term  = request.values.get('search_term', '')
+  page, count = search_page(Venue, search_term, Venue.id, Venue.name, Venue.upcoming_shows_count)
 
-  venues = list(Venue.query.filter(
-    Venue.name.ilike(f'%{search_term}%') |
-    Venue.city.ilike(f'%{search_term}%') |
-    Venue.state.ilike(f'%{search_term}%')
-  )).all()
-
-  response["count"] = len(venues)
-  response["data"] = []
+  response = {
+    "count": count,
+    "data": [],
+    "page": page
+  }
 
-  for venue in venues:
+  for venue in page:
     venue_unit = {
       "id": venue.id,
       "name": venue.name,
-      "num_upcoming_shows": len(list(filter(lambda x: x.start_time > datetime.now(), venue.shows)))
+      "num_upcoming_shows": venue.upcoming_shows_count
     }
     response["data"].append(venue_unit)
 
-  return render_template('pages/search_venues.html', results=response, search_term=request.form.get('search_term', ''))
+  return render_template('pages/search_venues.html', results=response, search_term=search_term)
   
 
   # TODO: implement search on venues with partial string search. Ensure it is case-insensitive.
@@ -173,41 +966,42 @@ def search_venues():
 
 
 @app.route('/venues/<int:venue_id>')
+@replicas.read_only
+@conditional(Venue)
 def show_venue(venue_id):
-  venue = Venue.query.get(venue_id)
-  setattr(venue, "genres", venue.genres.split(",")) # converts genres to list
-
-  #get past shows
-  past_shows = list(filter(lambda x: x.start_time < datetime.now(), venue.shows))
-  temp_shows = []
-
-  for show in past_shows:
-    temp = {}
-    temp["artist_id"] = show.artist_id
-    temp["artist_name"] = show.artist.name
-    temp["artist_image_link"] = show.artist.image_link
-    temp["start_time"] = show.start_time.strftime("%Y-%m-%d %H:%M:%S")
-    temp_shows.append(temp)
-
-  setattr(venue, "past_shows", temp_shows)
-  setattr(venue, "past_shows_count", len(temp_shows))
-
-  #get upcoming shows
-  upcoming_shows = list(filter(lambda x: x.start_time > datetime.now(), venue.shows))
-  temp_shows = []
-
-  for show in upcoming_shows:
-    temp ={}
-    temp["artist_id"] = show.artist_id
-    temp["artist_name"] = show.artist.name
-    temp["artist_image_link"] = show.artist.image_link
-    temp["start_time"] = show.start_time.strftime("%Y-%m-%d %H:%M:%S")
-    temp_shows.append(temp)
-  
-  setattr(venue, "upcoming_shows", temp_shows)
-  setattr(venue, "upcoming_shows_count", len(temp_shows))
-
-  return render_template('pages/show_venue.html', venue=venue)
+  venue = Venue.query.options(
+    noload(Venue.shows),
+    selectinload(Venue.genres)
+  ).get_or_404(venue_id)
+
+  shows = db.session.query(
+    Show.id,
+    Show.artist_id,
+    Artist.name.label('artist_name'),
+    Artist.image_link.label('artist_image_link'),
+    Show.start_time,
+    Show.updated_at,
+    Artist.updated_at.label('artist_updated_at')
+  ).join(Artist, Artist.id == Show.artist_id) \
+   .filter(Show.venue_id == venue.id)
+
+  upcoming_shows, upcoming_shows_count = show_partition(
+    shows, upcoming=True, limit=app.config['UPCOMING_SHOWS_LIMIT'],
+    total=venue.upcoming_shows_count
+  )
+  past_shows, past_shows_count = show_partition(
+    shows, upcoming=False, limit=app.config['PAST_SHOWS_LIMIT'],
+    total=venue.past_shows_count
+  )
+
+  return render_template('pages/show_venue.html',
+    venue=venue,
+    genres=[genre.name for genre in venue.genres],
+    upcoming_shows=[show_tile(show) for show in upcoming_shows],
+    upcoming_shows_count=upcoming_shows_count,
+    past_shows=[show_tile(show) for show in past_shows],
+    past_shows_count=past_shows_count
+  )
 
   # shows the venue page with the given venue_id
   # TODO: replace with real venue data from the venues table, using venue_id
@@ -233,16 +1027,18 @@ def create_venue_submission():
           state = form.state.data,
           address = form.address.data,
           phone = form.phone.data,
-          genres = ",".join(form.genres.data),#This coverts array to string with commas
+          genres = genres_named(form.genres.data),
           facebook_link = form.facebook_link.data,
           image_link = form.image_link.data,
           seeking_talent = form.seeking_talent.data,
           seeking_description = form.seeking_description.data,
-          website = form.website.data
+          website = form.website_link.data
         )
 
         db.session.add(new_venue) # Managing database transactions 
         db.session.commit()
+        response_cache.invalidate('venues')
+        index_document('Venue', new_venue.id, document_terms(new_venue, form.genres.data))
         flash('Venue ' + request.form['name'] + 'was successfully created and stored!')
     except Exception:
      db.session.rollback()
@@ -273,9 +1069,18 @@ def create_venue_submission():
 @app.route('/venues/<venue_id>', methods=['DELETE'])
 def delete_venue(venue_id):
   try:
-    venue = Venue.query.get(venue_id)
+    venue = Venue.query.options(noload(Venue.shows)).get(venue_id)
+    artist_ids = [artist_id for (artist_id,) in
+                  db.session.query(Show.artist_id).filter_by(venue_id=venue.id).distinct()]
+    # Remove the venue's shows in one statement instead of loading each one
+    # just so the ORM cascade can delete it row by row.
+    Show.query.filter_by(venue_id=venue.id).delete(synchronize_session=False)
+    if artist_ids:
+      refresh_show_counts(Artist, artist_ids)
     db.session.delete(venue)
     db.session.commit()
+    response_cache.invalidate('venues', 'shows')
+    unindex_document('Venue', venue.id)
     flash('Venue ' + venue.name + ' was successfully deleted!')
 
   except:
@@ -299,40 +1104,35 @@ def delete_venue(venue_id):
 #  Artists
 #  ----------------------------------------------------------------
 @app.route('/artists')
+@response_cache.cached('artists')
+@replicas.read_only
 def artists():
-  artist = db.session.query(Artist.id, Artist.name).all()
-  # TODO: replace with real data returned from querying the database
-  return render_template('pages/artists.html', artists=artist)
+  query = db.session.query(Artist.id, Artist.name, Artist.created_at)
+  page = paginated(with_genres(query, Artist), ARTIST_SORTS, 'name')
+  return render_template('pages/artists.html', artists=page, page=page)
 
-@app.route('/artists/search', methods=['POST'])
+@app.route('/artists/search', methods=['GET', 'POST'])
+@replicas.read_only
 def search_artists():
-  search_term  = request.form.get('search_term', '')
-  artists = Artist.query.filter(
-    Artist.name.ilike(f"%{search_term}%") |
-    Artist.city.ilike(f"%{search_term}%") |
-    Artist.state.ilike(f"%{search_term}%")
-  ).all()
+  search_term  = request.values.get('search_term', '')
+  page, count = search_page(Artist, search_term, Artist.id, Artist.name, Artist.upcoming_shows_count)
 
   response = {
-    "count": len(artists),
-    "data": []
+    "count": count,
+    "data": [],
+    "page": page
   }
 
-  for artist in artists:
+  for artist in page:
     temp = {}
     temp['id'] = artist.id
     temp['name'] = artist.name
-
-    upcoming_shows = 0
-    for show in artist.shows:
-      if show.start_time > datetime.now():
-        upcoming_shows += 1
-    temp['upcoming_shows'] = upcoming_shows
+    temp['upcoming_shows'] = artist.upcoming_shows_count
 
     response['data'].append(temp)
 
 
-  return render_template('pages/search_artists.html', results=response, search_term=request.form.get('search_term', ''))
+  return render_template('pages/search_artists.html', results=response, search_term=search_term)
 
   # TODO: implement search on artists with partial string search. Ensure it is case-insensitive.
   # seach for "A" should return "Guns N Petals", "Matt Quevado", and "The Wild Sax Band".
@@ -341,42 +1141,43 @@ def search_artists():
   
 
 @app.route('/artists/<int:artist_id>')
+@replicas.read_only
+@conditional(Artist)
 def show_artist(artist_id):
-  artist = Artist.query.get(artist_id)
-  setattr(artist, "genres", artist.genres.split(",")) #This coverts string to array
-
-  #past shows
-  past_shows = list(filter(lambda show: show.start_time < datetime.now(), artist.shows))
-  temp_shows = []
-
-  for show in past_shows:
-    temp = {}
-    temp["venue_id"] = show.venue_id
-    temp["venue_name"] = show.venue.name
-    temp["venue_image_link"] = show.venue.image_link
-    temp["start_time"] = show.start_time.strftime("%m/%d/%Y, %H:%M:%S")
-
-    temp_shows.append(temp)
-
-    setattr(artist, "past_shows", temp_shows)
-    setattr(artist, "past_shows_count", len(temp_shows))
-
-  #upcoming shows
-  upcoming_shows = list(filter(lambda show: show.start_time > datetime.now(), artist.shows))
-  temp_shows = []
-  for show in upcoming_shows:
-    temp = {}
-    temp["venue_id"] = show.venue_id
-    temp["venue_name"] = show.venue.name
-    temp["venue_image_link"] = show.venue.image_link
-    temp["start_time"] = show.start_time.strftime("%m/%d/%Y, %H:%M:%S")
+  artist = Artist.query.options(
+    noload(Artist.shows),
+    selectinload(Artist.genres)
+  ).get_or_404(artist_id)
+
+  shows = db.session.query(
+    Show.id,
+    Show.venue_id,
+    Venue.name.label('venue_name'),
+    Venue.image_link.label('venue_image_link'),
+    Show.start_time,
+    Show.updated_at,
+    Venue.updated_at.label('venue_updated_at')
+  ).join(Venue, Venue.id == Show.venue_id) \
+   .filter(Show.artist_id == artist.id)
+
+  upcoming_shows, upcoming_shows_count = show_partition(
+    shows, upcoming=True, limit=app.config['UPCOMING_SHOWS_LIMIT'],
+    total=artist.upcoming_shows_count
+  )
+  past_shows, past_shows_count = show_partition(
+    shows, upcoming=False, limit=app.config['PAST_SHOWS_LIMIT'],
+    total=artist.past_shows_count
+  )
+
+  return render_template('pages/show_artist.html',
+    artist=artist,
+    genres=[genre.name for genre in artist.genres],
+    upcoming_shows=[show_tile(show) for show in upcoming_shows],
+    upcoming_shows_count=upcoming_shows_count,
+    past_shows=[show_tile(show) for show in past_shows],
+    past_shows_count=past_shows_count
+  )
 
-    temp_shows.append(temp)
-
-    setattr(artist, "upcoming_shows", temp_shows)
-    setattr(artist, "upcoming_shows_count", len(temp_shows))
-
-    return render_template('pages/show_artist.html', artist=artist)
   # shows the artist page with the given artist_id
   # TODO: replace with real artist data from the artist table, using artist_id
 
@@ -389,8 +1190,11 @@ def show_artist(artist_id):
 @app.route('/artists/<int:artist_id>/edit', methods=['GET'])
 def edit_artist(artist_id):
   form = ArtistForm()
-  artist = Artist.query.get(artist_id)
-  form.genres.data = artist.genres.split(',')
+  artist = Artist.query.options(
+    noload(Artist.shows),
+    selectinload(Artist.genres)
+  ).get_or_404(artist_id)
+  form.genres.data = [genre.name for genre in artist.genres]
 
   return render_template('forms/edit_artist.html', form=form, artist=artist)
 
@@ -404,21 +1208,27 @@ def edit_artist_submission(artist_id):
 
   if form.validate():
     try:
-      artist = Artist.query.get(artist_id)
+      artist = Artist.query.options(noload(Artist.shows)).get(artist_id)
 
       artist.name = form.name.data
       artist.city =  form.city.data
       artist.state = form.state.data
       artist.phone = form.phone.data
-      artist.genres = ",".join(form.genres.data) # Converts array to string
+      artist.genres = genres_named(form.genres.data)
       artist.facebook_link = form.facebook_link.data
       artist.image_link = form.image_link.data
-      artist.website = form.website.data
+      artist.website = form.website_link.data
       artist.seeking_description = form.seeking_description.data
-      artist.seeking_venue = form.seeking_venue.data
+      artist.seeking_talent = form.seeking_venue.data
+      # Genres live in their own table; bump updated_at for the page
+      # validator even when nothing else changed.
+      artist.updated_at = datetime.utcnow()
+      touch_pages_showing(Artist, artist.id)
 
       db.session.add(artist)
       db.session.commit()
+      response_cache.invalidate('artists')
+      index_document('Artist', artist.id, document_terms(artist, form.genres.data))
       flash('Artist ' + request.form['name'] + ' was successfully updated!')
 
     except:
@@ -441,8 +1251,11 @@ def edit_artist_submission(artist_id):
 @app.route('/venues/<int:venue_id>/edit', methods=['GET'])
 def edit_venue(venue_id):
   form = VenueForm()
-  venue = Venue.query.get(venue_id)
-  form.genres.data = venue.genres.split(',') # convert string to list
+  venue = Venue.query.options(
+    noload(Venue.shows),
+    selectinload(Venue.genres)
+  ).get_or_404(venue_id)
+  form.genres.data = [genre.name for genre in venue.genres]
 
   return render_template('forms/edit_venue.html', form=form, venue=venue)
   
@@ -457,22 +1270,28 @@ def edit_venue_submission(venue_id):
 
    if form.validate():
     try:
-      venue = Venue.query.get(venue_id)
+      venue = Venue.query.options(noload(Venue.shows)).get(venue_id)
 
       venue.name = form.name.data
       venue.city = form.city.data
       venue.state = form.state.data
       venue.address = form.address.data
       venue.phone = form.phone.data
-      venue.genres = ",".join(form.genres.data)
+      venue.genres = genres_named(form.genres.data)
       venue.facebook_link = form.facebook_link.data
       venue.image_link = form.image_link.data
-      venue.website = form.website.data
+      venue.website = form.website_link.data
       venue.seeking_talent = form.seeking_talent.data
       venue.seeking_description = form.seeking_description.data
-      
+      # Genres live in their own table; bump updated_at for the page
+      # validator even when nothing else changed.
+      venue.updated_at = datetime.utcnow()
+      touch_pages_showing(Venue, venue.id)
+
       db.session.add(venue)
       db.session.commit()
+      response_cache.invalidate('venues')
+      index_document('Venue', venue.id, document_terms(venue, form.genres.data))
 
       flash('Venue ' + request.form['name'] + ' was successfully updated!')
 
@@ -514,16 +1333,18 @@ def create_artist_submission():
         city=form.city.data,
         state=form.state.data,
         phone=form.phone.data,
-        genres=",".join(form.genres.data), #converts array to string with comma
+        genres=genres_named(form.genres.data),
         image_link=form.image_link.data,
         facebook_link=form.facebook_link.data,
-        website=form.website.data,
-        seeking_venue=form.seeking_venue.data,
+        website=form.website_link.data,
+        seeking_talent=form.seeking_venue.data,
         seeking_description=form.seeking_description.data
       )
 
       db.session.add(new_artist)
       db.session.commit()
+      response_cache.invalidate('artists')
+      index_document('Artist', new_artist.id, document_terms(new_artist, form.genres.data))
       flash('Artist ' + request.form['name'] + ' was successfully listed!')
 
     except Exception:
@@ -558,24 +1379,48 @@ def create_artist_submission():
 #  ----------------------------------------------------------------
 
 @app.route('/shows')
+@response_cache.cached('shows', 'venues', 'artists')
+@replicas.read_only
 def shows():
   # displays list of shows at /shows
-  # TODO: replace with real venues data.
-  data = []
-
-  shows = Show.query.all()
-  for show in shows:
-    temp = {}
-    temp['venue_id'] = show.venue_id
-    temp['venue_name'] = show.venue.name
-    temp['artist_id'] = show.artist_id
-    temp['artist_name'] = show.artist.name
-    temp['artist_image_link'] = show.artist.image_link
-    temp['start_time'] = show.start_time
-
-    data.append(temp)
+  query = Show.query.options(
+    joinedload(Show.venue).load_only(Venue.name, Venue.updated_at),
+    joinedload(Show.artist).load_only(Artist.name, Artist.image_link, Artist.updated_at)
+  )
+  page = paginated(query, SHOW_SORTS, 'start_time', stream=streaming())
+
+  def show_tiles():
+    for show in page:
+      temp = {}
+      temp['id'] = show.id
+      temp['version'] = max(show.updated_at, show.venue.updated_at, show.artist.updated_at).isoformat()
+      temp['venue_id'] = show.venue_id
+      temp['venue_name'] = show.venue.name
+      temp['artist_id'] = show.artist_id
+      temp['artist_name'] = show.artist.name
+      temp['artist_image_link'] = show.artist.image_link
+      temp['start_time'] = show.start_time
+      yield temp
+
+  return render_listing('pages/shows.html', shows=show_tiles(), page=page)
+
+#  Export
+#  ----------------------------------------------------------------
 
-  return render_template('pages/shows.html', shows=data)
+@app.route('/export/<any(venues, artists, shows):kind>.<any(csv, ndjson):file_format>')
+@replicas.read_only
+def export(kind, file_format):
+  # Streamed in chunks as the rows come off the cursor, gzipped on the fly
+  # for clients that accept it.
+  compress = 'gzip' in request.accept_encodings
+  chunks = export_chunks(EXPORT_COLUMNS[kind], export_rows(kind), file_format, compress)
+
+  response = Response(stream_with_context(chunks), content_type=CONTENT_TYPES[file_format])
+  response.headers['Content-Disposition'] = f'attachment; filename={kind}.{file_format}'
+  response.headers['Vary'] = 'Accept-Encoding'
+  if compress:
+    response.headers['Content-Encoding'] = 'gzip'
+  return response
 
 @app.route('/shows/create')
 def create_shows():
@@ -595,7 +1440,9 @@ def create_show_submission():
         start_time=form.start_time.data
       )
       db.session.add(new_show)
+      count_show(new_show)
       db.session.commit()
+      response_cache.invalidate('shows')
       flash('Show was successfully listed!')
     except Exception:
       db.session.rollback()
@@ -620,6 +1467,21 @@ def create_show_submission():
   # e.g., flash('An error occurred. Show could not be listed.')
   # see: http://flask.pocoo.org/docs/1.0/patterns/flashing/
   
+#  Status
+#  ----------------------------------------------------------------
+
+@app.route('/status/pool')
+def pool_status_view():
+  replica_up = replicas.replicas.status()
+  databases = {'primary': pool_status(db.engine)}
+  for name in replica_up:
+    databases[name] = dict(pool_status(db.get_engine(app, bind=name)), up=replica_up[name])
+  return jsonify(databases)
+
+@app.route('/metrics')
+def metrics_view():
+  return Response(metrics.registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
 @app.errorhandler(404)
 def not_found_error(error):
     return render_template('errors/404.html'), 404
@@ -639,6 +1501,11 @@ if not app.debug:
     app.logger.addHandler(file_handler)
     app.logger.info('errors')
 
+# Loaded before the first request rather than by it; with gunicorn --preload
+# once, in the master, for all the workers.
+if app.config['PRELOAD_TEMPLATES']:
+    load_templates()
+
 #----------------------------------------------------------------------------#
 # Launch.
 #----------------------------------------------------------------------------#
@@ -0,0 +1,12 @@
+#----------------------------------------------------------------------------#
+# Route benchmarks: `python -m benchmarks.seed` fills a database at a chosen
+# scale and `python -m benchmarks.run` times every route against it,
+# comparing with benchmarks/baseline.json.
+#----------------------------------------------------------------------------#
+
+import os
+
+# The app needs a session key outside debug mode. A throwaway one will do
+# here; servers started by benchmarks.load inherit it, so all their workers
+# share it.
+os.environ.setdefault('FYYUR_SECRET_KEY', os.urandom(32).hex())
@@ -0,0 +1,266 @@
+#----------------------------------------------------------------------------#
+# Load test: drives a mix of listing, detail, search and create traffic at
+# increasing concurrency against a multi-worker server and reports, per
+# concurrency step, throughput, latency percentiles and error rates.
+#
+#   DATABASE_URL=postgresql://localhost/fyyur_bench python -m benchmarks.load \
+#       --workers 4 --concurrency 1,8,32,64 --duration 30
+#
+# The server is launched on a free local port: gunicorn with --workers
+# processes when it is installed, Werkzeug's forking server otherwise. Pass
+# --url to load a server that is already running instead. Seed the database
+# first (benchmarks/seed.py); the create traffic adds shows to it.
+#
+# Each simulated user keeps its own connection and cookies. Creating a show
+# first loads a form page for a CSRF token, as a browser would; the token
+# is taken from the venue edit form, the only form that renders one. The
+# route answers 200 either way, so a create only counts as a success when
+# the page carries its success message. The server inherits the session
+# key set up by the benchmarks package (FYYUR_SECRET_KEY), so all workers
+# accept each other's session cookies and tokens.
+#----------------------------------------------------------------------------#
+
+import argparse
+import http.client
+import importlib.util
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from urllib.parse import urlencode, urlsplit
+
+from benchmarks.run import percentile
+from benchmarks.seed import WORDS
+
+CSRF_RE = re.compile(r'name="csrf_token" type="hidden" value="([^"]+)"|'
+                     r'value="([^"]+)"[^>]*name="csrf_token"')
+
+# (weight, kind); the kinds are implemented by User below.
+MIX = [
+    (15, 'venues'), (10, 'artists'), (10, 'shows'),
+    (20, 'show_venue'), (20, 'show_artist'),
+    (10, 'search_venues'), (5, 'search_artists'),
+    (5, 'create_show'),
+]
+
+
+# Flashed by /shows/create on success only.
+CREATED = b'Show was successfully listed!'
+
+
+def ok(status):
+    return 0 < status < 400
+
+
+class User:
+    # One simulated visitor, with its own keep-alive connection and cookies.
+
+    def __init__(self, host, port, venue_ids, artist_ids, rng):
+        self.host, self.port = host, port
+        self.venue_ids, self.artist_ids = venue_ids, artist_ids
+        self.rng = rng
+        self.cookies = {}
+        self.connection = None
+
+    def request(self, method, path, form=None):
+        if self.connection is None:
+            self.connection = http.client.HTTPConnection(self.host, self.port, timeout=30)
+        headers = {}
+        body = None
+        if self.cookies:
+            headers['Cookie'] = '; '.join(f'{name}={value}' for name, value in self.cookies.items())
+        if form is not None:
+            body = urlencode(form, doseq=True)
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        try:
+            self.connection.request(method, path, body=body, headers=headers)
+            response = self.connection.getresponse()
+            data = response.read()
+        except (OSError, http.client.HTTPException):
+            self.connection.close()
+            self.connection = None
+            raise
+        for header in response.headers.get_all('Set-Cookie') or ():
+            name, _, rest = header.partition('=')
+            self.cookies[name.strip()] = rest.split(';', 1)[0]
+        if response.will_close:
+            self.connection.close()
+            self.connection = None
+        return response.status, data
+
+    def run(self, kind):
+        # Whether the request that the kind is measured by succeeded.
+        rng = self.rng
+        if kind in ('venues', 'artists', 'shows'):
+            return ok(self.request('GET', f'/{kind}')[0])
+        if kind == 'show_venue':
+            return ok(self.request('GET', f'/venues/{rng.choice(self.venue_ids)}')[0])
+        if kind == 'show_artist':
+            return ok(self.request('GET', f'/artists/{rng.choice(self.artist_ids)}')[0])
+        if kind in ('search_venues', 'search_artists'):
+            path = '/venues/search' if kind == 'search_venues' else '/artists/search'
+            return ok(self.request('GET', f'{path}?{urlencode({"search_term": rng.choice(WORDS).lower()})}')[0])
+
+        status, page = self.request('GET', f'/venues/{rng.choice(self.venue_ids)}/edit')
+        match = CSRF_RE.search(page.decode('utf-8', 'replace'))
+        if status != 200 or match is None:
+            return False
+        start_time = datetime.now() + timedelta(days=rng.randint(1, 365))
+        status, page = self.request('POST', '/shows/create', {
+            'csrf_token': match.group(1) or match.group(2),
+            'artist_id': rng.choice(self.artist_ids),
+            'venue_id': rng.choice(self.venue_ids),
+            'start_time': start_time.strftime('%Y-%m-%d %H:%M:%S'),
+        })
+        return ok(status) and CREATED in page
+
+
+class Step:
+    # Measurements of one concurrency step.
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def record(self, kind, seconds, ok):
+        with self.lock:
+            self.latencies[kind].append(seconds * 1000)
+            if not ok:
+                self.errors[kind] += 1
+
+
+def run_step(host, port, concurrency, duration, venue_ids, artist_ids, seed):
+    step = Step()
+    deadline = time.monotonic() + duration
+    weights = [weight for weight, _ in MIX]
+    kinds = [kind for _, kind in MIX]
+
+    def simulate(number):
+        rng = random.Random(seed * 10007 + number)
+        user = User(host, port, venue_ids, artist_ids, rng)
+        while time.monotonic() < deadline:
+            kind = rng.choices(kinds, weights)[0]
+            started = time.perf_counter()
+            try:
+                succeeded = user.run(kind)
+            except (OSError, http.client.HTTPException):
+                succeeded = False
+            step.record(kind, time.perf_counter() - started, succeeded)
+
+    threads = [threading.Thread(target=simulate, args=(number,), daemon=True)
+               for number in range(concurrency)]
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return step, time.monotonic() - started
+
+
+def report(concurrency, step, elapsed):
+    everything = [latency for latencies in step.latencies.values() for latency in latencies]
+    total = len(everything)
+    errors = sum(step.errors.values())
+    if not total:
+        print(f'concurrency {concurrency}: no requests completed')
+        return
+
+    print(f'\nconcurrency {concurrency}: {total / elapsed:.1f} req/s, '
+          f'p50 {percentile(everything, 0.50):.1f} ms, p95 {percentile(everything, 0.95):.1f} ms, '
+          f'p99 {percentile(everything, 0.99):.1f} ms, errors {100.0 * errors / total:.2f}%')
+    print(f"  {'kind':<16} {'count':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}")
+    for kind, latencies in sorted(step.latencies.items()):
+        print(f'  {kind:<16} {len(latencies):>7} {percentile(latencies, 0.50):>9.1f} '
+              f'{percentile(latencies, 0.95):>9.1f} {percentile(latencies, 0.99):>9.1f} '
+              f'{step.errors[kind]:>7}')
+
+
+def free_port():
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+
+def launch(port, workers):
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    if importlib.util.find_spec('gunicorn') is not None:
+        command = [sys.executable, '-m', 'gunicorn', '--workers', str(workers), '--preload',
+                   '--bind', f'127.0.0.1:{port}', '--log-level', 'warning', 'app:app']
+    else:
+        command = [sys.executable, '-c',
+                   'import sys; from werkzeug.serving import run_simple; from app import app; '
+                   'run_simple("127.0.0.1", int(sys.argv[1]), app, processes=int(sys.argv[2]))',
+                   str(port), str(workers)]
+    server = subprocess.Popen(command, cwd=root)
+
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise SystemExit(f'The server exited with status {server.returncode}')
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return server
+        except OSError:
+            time.sleep(0.2)
+    server.terminate()
+    raise SystemExit('The server did not start listening within 30 seconds')
+
+
+def sample_ids(limit):
+    # Ids to request, drawn from the database the server uses.
+    from app import app, db, Venue, Artist
+
+    with app.app_context():
+        venue_ids = [id for (id,) in db.session.query(Venue.id).order_by(db.func.random()).limit(limit)]
+        artist_ids = [id for (id,) in db.session.query(Artist.id).order_by(db.func.random()).limit(limit)]
+    if not venue_ids or not artist_ids:
+        raise SystemExit('The database has no venues or artists; seed it with benchmarks.seed first.')
+    return venue_ids, artist_ids
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Load test a local multi-worker server.')
+    parser.add_argument('--url', help='Load this running server instead of launching one.')
+    parser.add_argument('--workers', type=int, default=4, help='Server worker processes.')
+    parser.add_argument('--concurrency', default='1,4,16,32',
+                        help='Comma-separated simulated users per step.')
+    parser.add_argument('--duration', type=float, default=20, help='Seconds per step.')
+    parser.add_argument('--pause', type=float, default=2, help='Seconds between steps.')
+    parser.add_argument('--ids', type=int, default=1000, help='Venue and artist ids to draw from.')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    venue_ids, artist_ids = sample_ids(args.ids)
+    steps = [int(value) for value in args.concurrency.split(',')]
+
+    server = None
+    if args.url:
+        address = urlsplit(args.url)
+        host, port = address.hostname, address.port or 80
+    else:
+        host, port = '127.0.0.1', free_port()
+        server = launch(port, args.workers)
+        print(f'Server started on port {port} with {args.workers} workers')
+
+    try:
+        for number, concurrency in enumerate(steps):
+            if number:
+                time.sleep(args.pause)
+            step, elapsed = run_step(host, port, concurrency, args.duration,
+                                     venue_ids, artist_ids, args.seed + number)
+            report(concurrency, step, elapsed)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(10)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,274 @@
+#----------------------------------------------------------------------------#
+# Times every route through the Flask test client against a seeded
+# database (see benchmarks/seed.py) and compares with a stored baseline.
+#
+#   DATABASE_URL=postgresql://localhost/fyyur_bench python -m benchmarks.run
+#   DATABASE_URL=... python -m benchmarks.run --save-baseline
+#
+# Per route it records latency percentiles over --iterations requests (after
+# --warmup), the SQL statements per request and the peak Python memory
+# allocated by one request (a separate, tracemalloc'ed pass, so tracing does
+# not skew the timings). The run fails, exiting 1, when a route needs more
+# queries than the baseline, or its p50/p95 latency or peak memory grew by
+# more than --tolerance (ignoring differences below --min-delta-ms for
+# latencies, which are noise at that size).
+#
+# A write scenario fails unless the route flashes its success message. The
+# writes edit and book shows for a scratch venue and artist rather than the
+# rows the read scenarios measure, and every row they add is deleted at
+# the end, so runs against the same database stay comparable.
+#
+# The response and fragment caches are off, so every scenario measures the
+# view's real work; the *_cached scenarios measure the same pages served
+# from a warm cache.
+#----------------------------------------------------------------------------#
+
+import argparse
+import json
+import math
+import os
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+BASELINE = os.path.join(os.path.dirname(__file__), 'baseline.json')
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, math.ceil(fraction * len(ordered)) - 1)]
+
+
+def high_water_marks(app):
+    # The largest venue, artist and show ids before the run.
+    from app import db, Venue, Artist, Show
+
+    with app.app_context():
+        return {model: db.session.query(db.func.max(model.id)).scalar() or 0
+                for model in (Venue, Artist, Show)}
+
+
+def remove_written(app, marks):
+    # Deletes the rows added since marks were taken, shows first.
+    from app import db, Venue, Artist, Show, venue_genres, artist_genres
+
+    with app.app_context():
+        db.session.query(Show).filter(Show.id > marks[Show]).delete(synchronize_session=False)
+        for association, foreign_key, model in ((venue_genres, venue_genres.c.venue_id, Venue),
+                                                (artist_genres, artist_genres.c.artist_id, Artist)):
+            db.session.execute(association.delete().where(foreign_key > marks[model]))
+            db.session.query(model).filter(model.id > marks[model]).delete(synchronize_session=False)
+        db.session.commit()
+
+
+def scenarios(app):
+    # (name, method, url, form data, success flash). Ids are picked from the
+    # middle of the seeded ranges so detail pages have shows on both sides
+    # of now; the writes go to a scratch venue and artist added here.
+    from app import db, Venue, Artist
+
+    with app.app_context():
+        venue_id = db.session.query(Venue.id).order_by(Venue.id) \
+            .offset(db.session.query(Venue.id).count() // 2).limit(1).scalar()
+        artist_id = db.session.query(Artist.id).order_by(Artist.id) \
+            .offset(db.session.query(Artist.id).count() // 2).limit(1).scalar()
+        scratch_venue = Venue(name='Benchmark Scratch Hall', city='San Francisco', state='CA')
+        scratch_artist = Artist(name='Benchmark Scratch Band', city='San Francisco', state='CA')
+        db.session.add_all([scratch_venue, scratch_artist])
+        db.session.commit()
+        scratch_venue_id, scratch_artist_id = scratch_venue.id, scratch_artist.id
+
+    start_time = (datetime.utcnow() + timedelta(days=30)).strftime('%Y-%m-%d %H:%M:%S')
+    venue_form = {
+        'name': 'Benchmark Hall', 'city': 'San Francisco', 'state': 'CA', 'address': '1 Main Street',
+        'phone': '415-555-0100', 'genres': ['Jazz', 'Folk'], 'facebook_link': 'https://www.facebook.com/bench',
+        'website_link': 'https://bench.example.com',
+    }
+    artist_form = dict(venue_form, name='Benchmark Band')
+    del artist_form['address']
+
+    return [
+        ('index', 'GET', '/', None, None),
+        ('venues', 'GET', '/venues', None, None),
+        ('venues_by_name', 'GET', '/venues?sort=name', None, None),
+        ('venues_genre', 'GET', '/venues?genre=Jazz', None, None),
+        ('search_venues', 'GET', '/venues/search?search_term=hall', None, None),
+        ('show_venue', 'GET', f'/venues/{venue_id}', None, None),
+        ('edit_venue', 'GET', f'/venues/{venue_id}/edit', None, None),
+        ('create_venue_form', 'GET', '/venues/create', None, None),
+        ('artists', 'GET', '/artists', None, None),
+        ('search_artists', 'GET', '/artists/search?search_term=wolves', None, None),
+        ('show_artist', 'GET', f'/artists/{artist_id}', None, None),
+        ('edit_artist', 'GET', f'/artists/{artist_id}/edit', None, None),
+        ('create_artist_form', 'GET', '/artists/create', None, None),
+        ('shows', 'GET', '/shows', None, None),
+        ('create_show_form', 'GET', '/shows/create', None, None),
+        ('venues_cached', 'GET', '/venues', None, None),
+        ('artists_cached', 'GET', '/artists', None, None),
+        ('shows_cached', 'GET', '/shows', None, None),
+        ('export_venues', 'GET', '/export/venues.csv', None, None),
+        ('create_venue', 'POST', '/venues/create', venue_form, 'was successfully'),
+        ('create_artist', 'POST', '/artists/create', artist_form, 'was successfully'),
+        ('create_show', 'POST', '/shows/create',
+         {'artist_id': scratch_artist_id, 'venue_id': scratch_venue_id, 'start_time': start_time},
+         'was successfully'),
+        ('edit_venue_submission', 'POST', f'/venues/{scratch_venue_id}/edit', venue_form, 'was successfully'),
+        ('edit_artist_submission', 'POST', f'/artists/{scratch_artist_id}/edit', artist_form, 'was successfully'),
+    ]
+
+
+def set_caching(app, enabled):
+    # Turns the response and fragment caches on or off, emptied either way.
+    from app import response_cache
+    from cache import TaggedCache
+
+    app.config['RESPONSE_CACHE'] = app.config['FRAGMENT_CACHE'] = enabled
+    response_cache.enabled = enabled
+    app.jinja_env.fragment_cache = TaggedCache(response_cache.backend) if enabled else None
+    response_cache.backend.clear()
+
+
+def succeeded(client, response, expect):
+    # Whether the page, or for a redirect the session, carries a flashed
+    # message containing expect; pending flashes are cleared either way.
+    with client.session_transaction() as session:
+        flashes = session.pop('_flashes', [])
+    if expect is None:
+        return True
+    return expect in response.get_data(as_text=True) or \
+        any(expect in message for _, message in flashes)
+
+
+def measure(app, client, method, url, data, expect, iterations, warmup):
+    from instrumentation import current_stats
+
+    query_counts = []
+
+    def count_queries(response):
+        stats = current_stats()
+        query_counts.append(stats.count if stats is not None else 0)
+        return response
+
+    app.after_request_funcs.setdefault(None, []).insert(0, count_queries)
+    try:
+        def call():
+            # Seconds taken by the request alone, not the checks after it.
+            started = time.perf_counter()
+            response = client.open(url, method=method, data=data)
+            response.get_data()
+            elapsed = time.perf_counter() - started
+            if response.status_code >= 500:
+                raise RuntimeError(f'{method} {url} answered {response.status_code}')
+            if not succeeded(client, response, expect):
+                raise RuntimeError(f'{method} {url} did not flash {expect!r}')
+            return elapsed
+
+        for _ in range(warmup):
+            call()
+
+        del query_counts[:]
+        latencies = [call() * 1000 for _ in range(iterations)]
+
+        tracemalloc.start()
+        call()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    finally:
+        app.after_request_funcs[None].remove(count_queries)
+
+    return {
+        'p50_ms': round(percentile(latencies, 0.50), 2),
+        'p95_ms': round(percentile(latencies, 0.95), 2),
+        'p99_ms': round(percentile(latencies, 0.99), 2),
+        'queries': max(query_counts) if query_counts else 0,
+        'peak_kb': round(peak / 1024, 1),
+    }
+
+
+def compare(results, baseline, tolerance, min_delta_ms):
+    failures = []
+    for name, result in results.items():
+        expected = baseline.get(name)
+        if expected is None:
+            continue
+        if result['queries'] > expected['queries']:
+            failures.append(f"{name}: {result['queries']} queries, baseline {expected['queries']}")
+        for key in ('p50_ms', 'p95_ms'):
+            if result[key] > expected[key] * (1 + tolerance) and result[key] - expected[key] > min_delta_ms:
+                failures.append(f'{name}: {key} {result[key]}, baseline {expected[key]}')
+        if result['peak_kb'] > expected['peak_kb'] * (1 + tolerance):
+            failures.append(f"{name}: peak {result['peak_kb']} KiB, baseline {expected['peak_kb']} KiB")
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark every route against DATABASE_URL.')
+    parser.add_argument('--iterations', type=int, default=30)
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--only', action='append', help='Run only this scenario (repeatable).')
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='Write the results as the new baseline instead of comparing.')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='Allowed relative growth of latency and memory.')
+    parser.add_argument('--min-delta-ms', type=float, default=2.0)
+    parser.add_argument('--output', help='Also write the results to this JSON file.')
+    args = parser.parse_args(argv)
+
+    from app import app
+    app.config['WTF_CSRF_ENABLED'] = False
+    set_caching(app, False)
+    client = app.test_client()
+
+    results, errors = {}, []
+    print(f"{'route':<24} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'queries':>8} {'peak KiB':>10}")
+    marks = high_water_marks(app)
+    try:
+        for name, method, url, data, expect in scenarios(app):
+            if args.only and name not in args.only:
+                continue
+            cached = name.endswith('_cached')
+            if cached:
+                set_caching(app, True)
+            try:
+                result = results[name] = measure(app, client, method, url, data, expect,
+                                                 args.iterations, args.warmup)
+            except Exception as error:
+                errors.append(f'{name}: {type(error).__name__}: {error}')
+                print(f'{name:<24} failed: {type(error).__name__}: {error}')
+                continue
+            finally:
+                if cached:
+                    set_caching(app, False)
+            print(f"{name:<24} {result['p50_ms']:>9} {result['p95_ms']:>9} {result['p99_ms']:>9} "
+                  f"{result['queries']:>8} {result['peak_kb']:>10}")
+    finally:
+        remove_written(app, marks)
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2, sort_keys=True)
+
+    for error in errors:
+        print(f'ERROR {error}')
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as output:
+            json.dump(results, output, indent=2, sort_keys=True)
+        print(f'Baseline written to {args.baseline}')
+        return 1 if errors else 0
+
+    if not os.path.exists(args.baseline):
+        print(f'No baseline at {args.baseline}; record one with --save-baseline.')
+        return 1 if errors else 0
+
+    with open(args.baseline) as stored:
+        failures = compare(results, json.load(stored), args.tolerance, args.min_delta_ms)
+    for failure in failures:
+        print(f'REGRESSION {failure}')
+    return 1 if failures or errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
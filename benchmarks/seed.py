@@ -0,0 +1,163 @@
+#----------------------------------------------------------------------------#
+# Seeds a benchmark database with generated venues, artists, genres and
+# shows.
+#
+#   DATABASE_URL=postgresql://localhost/fyyur_bench flask db upgrade
+#   DATABASE_URL=postgresql://localhost/fyyur_bench python -m benchmarks.seed --scale large
+#
+# The data is generated from a fixed random seed, so two databases seeded
+# at the same scale hold the same rows and benchmark results compare.
+# Rows are written with multi-row INSERTs in batches, bypassing the ORM.
+#----------------------------------------------------------------------------#
+
+import argparse
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert, inspect, text
+
+SCALES = {
+    'small': dict(venues=200, artists=1000, shows=20000),
+    'medium': dict(venues=2000, artists=10000, shows=500000),
+    'large': dict(venues=10000, artists=100000, shows=5000000),
+}
+
+BATCH_SIZE = 10000
+
+CITIES = [
+    ('San Francisco', 'CA'), ('Los Angeles', 'CA'), ('San Diego', 'CA'), ('New York', 'NY'),
+    ('Brooklyn', 'NY'), ('Buffalo', 'NY'), ('Austin', 'TX'), ('Houston', 'TX'), ('Dallas', 'TX'),
+    ('Chicago', 'IL'), ('Seattle', 'WA'), ('Portland', 'OR'), ('Denver', 'CO'), ('Boston', 'MA'),
+    ('Nashville', 'TN'), ('Memphis', 'TN'), ('New Orleans', 'LA'), ('Atlanta', 'GA'),
+    ('Miami', 'FL'), ('Detroit', 'MI'), ('Minneapolis', 'MN'), ('Philadelphia', 'PA'),
+]
+
+WORDS = ['Blue', 'Red', 'Golden', 'Velvet', 'Electric', 'Midnight', 'Silver', 'Wild', 'Lucky',
+         'Hidden', 'Broken', 'Northern', 'Crystal', 'Neon', 'Rusty', 'Howling', 'Little', 'Grand']
+VENUE_NOUNS = ['Hall', 'Room', 'Lounge', 'Club', 'Hop', 'Tavern', 'Theatre', 'Cellar', 'Garden']
+ARTIST_NOUNS = ['Wolves', 'Kings', 'Riders', 'Sisters', 'Machines', 'Owls', 'Saints', 'Echoes']
+
+
+def batched(rows):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == BATCH_SIZE:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def write(session, table, rows, label, total):
+    written = 0
+    started = time.monotonic()
+    for batch in batched(rows):
+        session.execute(insert(table), batch)
+        session.commit()
+        written += len(batch)
+        print(f'\r{label}: {written}/{total}', end='', file=sys.stderr)
+    print(f'\r{label}: {written} rows in {time.monotonic() - started:.1f}s', file=sys.stderr)
+
+
+def seed(app, venues, artists, shows, genres_per_owner=3, random_seed=0):
+    from app import db, Genre, Venue, Artist, Show, venue_genres, artist_genres, refresh_show_counts
+    from forms import VenueForm
+
+    rng = random.Random(random_seed)
+    now = datetime.utcnow().replace(microsecond=0)
+
+    with app.app_context():
+        session = db.session
+        if not inspect(session.connection()).has_table(Venue.__tablename__):
+            db.create_all()
+        if session.query(Venue.id).first() is not None or session.query(Show.id).first() is not None:
+            raise SystemExit('The database already holds venues or shows; seed an empty one.')
+
+        genre_names = [name for name, _ in VenueForm.genres.kwargs['choices']]
+        existing = {genre.name for genre in Genre.query}
+        session.add_all([Genre(name=name) for name in genre_names if name not in existing])
+        session.commit()
+        genre_ids = [genre.id for genre in Genre.query.order_by(Genre.id)]
+
+        def owner(i, nouns, prefix):
+            city, state = CITIES[rng.randrange(len(CITIES))]
+            return dict(
+                id=i,
+                name=f'{rng.choice(WORDS)} {rng.choice(nouns)} {i}',
+                city=city,
+                state=state,
+                phone=f'{rng.randrange(200, 999)}-{rng.randrange(200, 999)}-{rng.randrange(1000, 9999)}',
+                image_link=f'https://images.example.com/{prefix}/{i}.jpg',
+                facebook_link=f'https://www.facebook.com/{prefix}{i}',
+                website=f'https://{prefix}{i}.example.com',
+                seeking_talent=rng.random() < 0.3,
+                seeking_description=None,
+                created_at=now - timedelta(minutes=rng.randrange(60 * 24 * 365 * 3)),
+            )
+
+        def venue_rows():
+            for i in range(1, venues + 1):
+                row = owner(i, VENUE_NOUNS, 'venue')
+                row['address'] = f'{rng.randrange(1, 9999)} Main Street'
+                yield row
+
+        def genre_links(count, key):
+            for i in range(1, count + 1):
+                for genre_id in rng.sample(genre_ids, rng.randint(1, genres_per_owner)):
+                    yield {'genre_id': genre_id, key: i}
+
+        def show_rows():
+            # Two thirds in the past, the rest over the coming year.
+            for i in range(1, shows + 1):
+                offset = timedelta(minutes=rng.randrange(-60 * 24 * 730, 60 * 24 * 365))
+                yield dict(id=i, venue_id=rng.randint(1, venues), artist_id=rng.randint(1, artists),
+                           start_time=now + offset)
+
+        write(session, Venue.__table__, venue_rows(), 'venues', venues)
+        write(session, Artist.__table__, (owner(i, ARTIST_NOUNS, 'artist') for i in range(1, artists + 1)),
+              'artists', artists)
+        write(session, venue_genres, genre_links(venues, 'venue_id'), 'venue genres', '?')
+        write(session, artist_genres, genre_links(artists, 'artist_id'), 'artist genres', '?')
+        write(session, Show.__table__, show_rows(), 'shows', shows)
+
+        print('show counters', file=sys.stderr)
+        refresh_show_counts(Venue)
+        refresh_show_counts(Artist)
+
+        if session.connection().dialect.name == 'postgresql':
+            # The rows were written with explicit ids; move the sequences on
+            # past them and give the planner fresh statistics.
+            for table in ('Venue', 'Artist', 'Show'):
+                session.execute(text(
+                    f"SELECT setval(pg_get_serial_sequence('\"{table}\"', 'id'), "
+                    f"(SELECT max(id) FROM \"{table}\"))"
+                ))
+            session.commit()
+            with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+                connection.execute(text('ANALYZE'))
+        session.commit()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Seed a benchmark database (DATABASE_URL).')
+    parser.add_argument('--scale', choices=SCALES, default='small')
+    parser.add_argument('--venues', type=int)
+    parser.add_argument('--artists', type=int)
+    parser.add_argument('--shows', type=int)
+    parser.add_argument('--seed', type=int, default=0, help='Random seed.')
+    args = parser.parse_args(argv)
+
+    counts = dict(SCALES[args.scale])
+    for key in counts:
+        if getattr(args, key) is not None:
+            counts[key] = getattr(args, key)
+
+    from app import app
+    seed(app, random_seed=args.seed, **counts)
+
+
+if __name__ == '__main__':
+    main()
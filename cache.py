@@ -0,0 +1,239 @@
+#----------------------------------------------------------------------------#
+# Response caching.
+#
+# Backends store bytes-or-objects under string keys with a time to live;
+# MemoryCache is an in-process LRU bounded by entry count, NullCache turns
+# caching off, and anything with the same get/set/delete methods (a Redis or
+# memcached client wrapper, say) can be plugged in through CACHE_BACKEND.
+#
+# Invalidation is by tag: every cached entry's key includes the current
+# version of each tag it depends on ('venues', 'shows', ...), and a write
+# bumps the versions of the tags it touches, so the next read misses and
+# the stale entries age out. Versions live in the backend, so with a shared
+# backend one worker's write reaches them all; with MemoryCache other
+# workers catch up within the TTL.
+#
+# Template fragments are cached with FragmentCacheExtension:
+#
+#   {% cache [show.id, show.version], 3600 %} ... {% endcache %}
+#
+# The key should change whenever the fragment would, so no invalidation is
+# needed; the template name and line are added to it.
+#----------------------------------------------------------------------------#
+
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from functools import wraps
+from importlib import import_module
+
+from jinja2 import nodes
+from jinja2.ext import Extension
+from flask import Response, has_request_context, make_response, request, session
+from markupsafe import Markup
+
+from metrics import record_cache
+
+
+class MemoryCache:
+
+    def __init__(self, max_entries=10000, default_ttl=60):
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires is not None and expires <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        ttl = self.default_ttl if ttl is None else ttl
+        expires = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._entries[key] = (expires, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class NullCache:
+
+    def get(self, key):
+        return None
+
+    def set(self, key, value, ttl=None):
+        pass
+
+    def delete(self, key):
+        pass
+
+    def clear(self):
+        pass
+
+
+def make_backend(config):
+    # CACHE_BACKEND is 'memory', 'null' or 'package.module:factory', the
+    # factory being called with the app config.
+    backend = config.get('CACHE_BACKEND', 'memory')
+    if backend == 'memory':
+        return MemoryCache(config.get('CACHE_MAX_ENTRIES', 10000), config.get('CACHE_DEFAULT_TTL', 60))
+    if backend == 'null':
+        return NullCache()
+    module, _, name = backend.partition(':')
+    return getattr(import_module(module), name)(config)
+
+
+class TaggedCache:
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def version(self, tag):
+        # An unknown (or evicted) version is replaced by a fresh one, which
+        # can only cause misses, never a stale hit.
+        key = f'version:{tag}'
+        version = self.backend.get(key)
+        if version is None:
+            version = uuid.uuid4().hex[:12]
+            self.backend.set(key, version, 0)
+        return version
+
+    def invalidate(self, *tags):
+        for tag in tags:
+            self.backend.set(f'version:{tag}', uuid.uuid4().hex[:12], 0)
+
+    def key(self, prefix, name, tags):
+        versions = ','.join(self.version(tag) for tag in tags)
+        return f'{prefix}:{name}:{versions}'
+
+    def get(self, key, kind):
+        value = self.backend.get(key)
+        record_cache(kind, value is not None)
+        return value
+
+    def set(self, key, value, ttl=None):
+        self.backend.set(key, value, ttl)
+
+
+class ResponseCache(TaggedCache):
+
+    def __init__(self, app=None, bypass=None):
+        # bypass is called per request; a true result skips the cache both
+        # ways.
+        self.bypass = bypass
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('RESPONSE_CACHE', True)
+        app.config.setdefault('CACHE_BACKEND', 'memory')
+        app.config.setdefault('CACHE_MAX_ENTRIES', 10000)
+        app.config.setdefault('CACHE_DEFAULT_TTL', 60)
+        self.enabled = app.config['RESPONSE_CACHE']
+        self.ttl = app.config['CACHE_DEFAULT_TTL']
+        super().__init__(make_backend(app.config))
+
+    def invalidate(self, *tags):
+        super().invalidate(*tags)
+        # Another worker may still hold the old pages; the user who made
+        # the change skips the cache until they have expired there, so they
+        # always see it.
+        if has_request_context():
+            session['_uncached_until'] = time.time() + self.ttl
+
+    def cacheable(self):
+        if not self.enabled or request.method != 'GET':
+            return False
+        # The layout pops flashed messages, which are per user.
+        if session.get('_flashes') or session.get('_uncached_until', 0) > time.time():
+            return False
+        return not (self.bypass is not None and self.bypass())
+
+    def cached(self, *tags, ttl=None):
+        # Caches the view's 200 responses per URL until any of tags is
+        # invalidated or ttl (the backend default if None) runs out.
+        def decorator(view):
+            @wraps(view)
+            def cached_view(*args, **kwargs):
+                if not self.cacheable():
+                    return view(*args, **kwargs)
+
+                key = self.key('response', request.full_path, tags)
+                hit = self.get(key, 'response')
+                if hit is not None:
+                    body, content_type = hit
+                    return Response(body, content_type=content_type)
+
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+                if response.is_streamed:
+                    response.response = self._stored(key, response.response, response.charset, response.content_type, ttl)
+                else:
+                    self.set(key, (response.get_data(), response.content_type), ttl)
+                return response
+            return cached_view
+        return decorator
+
+    def _stored(self, key, body, charset, content_type, ttl):
+        # Passes the chunks on as they come and stores the whole body once
+        # the last one has been sent.
+        chunks = []
+        for chunk in body:
+            if isinstance(chunk, str):
+                chunk = chunk.encode(charset)
+            chunks.append(chunk)
+            yield chunk
+        self.set(key, (b''.join(chunks), content_type), ttl)
+
+
+class FragmentCacheExtension(Extension):
+    # {% cache key[, ttl] %}...{% endcache %}, where key is a value or a list
+    # of values. Caches nothing until environment.fragment_cache is set to a
+    # TaggedCache.
+    tags = {'cache'}
+
+    def __init__(self, environment):
+        super().__init__(environment)
+        environment.extend(fragment_cache=None)
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        args = [nodes.Const(f'{parser.name}:{lineno}'), parser.parse_expression()]
+        if parser.stream.skip_if('comma'):
+            args.append(parser.parse_expression())
+        else:
+            args.append(nodes.Const(None))
+        body = parser.parse_statements(['name:endcache'], drop_needle=True)
+        return nodes.CallBlock(self.call_method('_cached', args), [], [], body).set_lineno(lineno)
+
+    def _cached(self, name, key, ttl, caller):
+        cache = self.environment.fragment_cache
+        if cache is None:
+            return caller()
+        if isinstance(key, (list, tuple)):
+            key = ':'.join(str(part) for part in key)
+        key = f'fragment:{name}:{key}'
+        fragment = cache.get(key, 'fragment')
+        if fragment is None:
+            fragment = str(caller())
+            cache.set(key, fragment, ttl)
+        return Markup(fragment)
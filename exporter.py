@@ -0,0 +1,80 @@
+#----------------------------------------------------------------------------#
+# Streaming export of venues, artists and shows (see /export and
+# `flask export`).
+#
+# Rows arrive from a server-side cursor and leave as encoded chunks, so
+# only one batch of rows and one output chunk are ever held in memory. The
+# columns are named after the form fields, so an export can be loaded back
+# with `flask import`.
+#----------------------------------------------------------------------------#
+
+import csv
+import io
+import json
+import zlib
+from datetime import date
+
+CHUNK_SIZE = 64 * 1024
+
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson; charset=utf-8',
+}
+
+
+def _json_default(value):
+    # Dates as the CSV writer prints them, which is what the forms parse.
+    if isinstance(value, date):
+        return str(value)
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+def csv_lines(columns, rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for row in rows:
+        writer.writerow([
+            ', '.join(row[column]) if isinstance(row[column], list) else row[column]
+            for column in columns
+        ])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    # The header alone, for an empty export.
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def ndjson_lines(columns, rows):
+    for row in rows:
+        yield json.dumps({column: row[column] for column in columns}, default=_json_default) + '\n'
+
+
+def encode(lines, compress=False, chunk_size=CHUNK_SIZE):
+    # Gathers lines into chunks of about chunk_size bytes, gzipped on the fly
+    # when compress is set (wbits=31 writes the gzip header and trailer).
+    compressor = zlib.compressobj(wbits=31) if compress else None
+    pending, size = [], 0
+    for line in lines:
+        data = line.encode('utf-8')
+        pending.append(data)
+        size += len(data)
+        if size >= chunk_size:
+            chunk = b''.join(pending)
+            pending, size = [], 0
+            if compressor is not None:
+                chunk = compressor.compress(chunk)
+            if chunk:
+                yield chunk
+
+    chunk = b''.join(pending)
+    if compressor is not None:
+        chunk = compressor.compress(chunk) + compressor.flush()
+    if chunk:
+        yield chunk
+
+
+def export_chunks(columns, rows, file_format, compress=False):
+    lines = csv_lines(columns, rows) if file_format == 'csv' else ndjson_lines(columns, rows)
+    return encode(lines, compress)
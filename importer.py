@@ -0,0 +1,262 @@
+#----------------------------------------------------------------------------#
+# Bulk loading of venues, artists and shows (see `flask import`).
+#
+# Rows are streamed from CSV or NDJSON, validated with the same WTForms
+# forms the site uses, and written in bounded batches: one multi-row
+# INSERT (an upsert on id when the file carries ids) or, for shows on
+# PostgreSQL, one COPY per batch. Rows that fail validation, or whose
+# batch the database refuses, end up in a rejects file with the reason.
+#----------------------------------------------------------------------------#
+
+import csv
+import io
+import json
+from itertools import islice
+
+from sqlalchemy import insert, text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.exc import SQLAlchemyError
+from werkzeug.datastructures import MultiDict
+
+
+class MalformedRow(str):
+    # An NDJSON line that is not a JSON object, yielded in place of a row so
+    # that it is rejected like any other invalid row; error says why.
+
+    def __new__(cls, line, error):
+        row = super().__new__(cls, line)
+        row.error = error
+        return row
+
+
+def read_rows(stream, file_format):
+    # Yields (line number, row dict) without reading the file into memory.
+    if file_format == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+    else:
+        for line_number, line in enumerate(stream, 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as error:
+                yield line_number, MalformedRow(line.rstrip('\n'), f'Not valid JSON: {error}')
+                continue
+            if not isinstance(row, dict):
+                yield line_number, MalformedRow(line.rstrip('\n'), 'Not a JSON object.')
+                continue
+            yield line_number, row
+
+
+def form_data(row):
+    # Turns a parsed row into the form data a browser would have posted.
+    formdata = MultiDict()
+    for key, value in row.items():
+        if value is None or value == '':
+            continue
+        if key == 'genres' and isinstance(value, str):
+            value = [genre.strip() for genre in value.split(',') if genre.strip()]
+        if isinstance(value, list):
+            for item in value:
+                formdata.add(key, str(item))
+        elif isinstance(value, bool):
+            if value:
+                formdata.add(key, 'y')
+        elif str(value).lower() in ('true', 'false') and key.startswith('seeking_'):
+            if str(value).lower() == 'true':
+                formdata.add(key, 'y')
+        else:
+            formdata.add(key, str(value))
+    return formdata
+
+
+def batches(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+class BulkImport:
+    # Loads rows of one kind. `values` maps a validated form to column
+    # values; `association` (a VenueGenre/ArtistGenre table) and
+    # `genres_named` link genre names when the kind has genres;
+    # `after_batch` is called with the loaded rows' column values and ids
+    # (empty when loaded with COPY) after each batch, inside its
+    # transaction.
+
+    def __init__(self, session, model, form_class, values, association=None,
+                 owner_key=None, genres_named=None, after_batch=None, use_copy=True):
+        self.session = session
+        self.table = model.__table__
+        self.form_class = form_class
+        self.values = values
+        self.association = association
+        self.owner_key = owner_key
+        self.genres_named = genres_named
+        self.after_batch = after_batch
+        self.use_copy = use_copy
+
+        self.read = self.loaded = self.rejected = 0
+        self.explicit_ids = False
+
+    def validate(self, row):
+        if isinstance(row, MalformedRow):
+            return None, {'row': [row.error]}
+        form = self.form_class(formdata=form_data(row), meta={'csrf': False})
+        if not form.validate():
+            return None, form.errors
+
+        try:
+            values = self.values(form)
+        except ValueError as error:
+            return None, {'row': [str(error)]}
+        if row.get('id') not in (None, ''):
+            try:
+                values['id'] = int(row['id'])
+            except (TypeError, ValueError):
+                return None, {'id': ['Not a valid integer.']}
+        genres = form.genres.data if self.association is not None else None
+        return (values, genres), None
+
+    def run(self, rows, batch_size, rejects, progress):
+        for batch in batches(rows, batch_size):
+            valid = []
+            for line_number, row in batch:
+                self.read += 1
+                loaded, errors = self.validate(row)
+                if errors:
+                    self.reject(rejects, line_number, row, errors)
+                else:
+                    valid.append((line_number, row, loaded))
+
+            if valid:
+                self.load_batch(valid, rejects)
+            progress(self)
+
+    def load_batch(self, valid, rejects):
+        try:
+            self.write([loaded for _, _, loaded in valid])
+            self.session.commit()
+            self.loaded += len(valid)
+        except SQLAlchemyError as error:
+            self.session.rollback()
+            if len(valid) == 1:
+                line_number, row, _ = valid[0]
+                self.reject(rejects, line_number, row, {'database': [str(getattr(error, 'orig', None) or error)]})
+                return
+            # Retry row by row so one bad row does not sink its batch.
+            for item in valid:
+                self.load_batch([item], rejects)
+
+    def finish(self):
+        # Rows loaded with their own ids bypass the id sequence; move it
+        # past them so later inserts do not collide.
+        if self.explicit_ids and self.session.connection().dialect.name == 'postgresql':
+            self.session.execute(text(
+                f"SELECT setval(pg_get_serial_sequence('\"{self.table.name}\"', 'id'), "
+                f"(SELECT max(id) FROM \"{self.table.name}\"))"
+            ))
+            self.session.commit()
+
+    def reject(self, rejects, line_number, row, errors):
+        self.rejected += 1
+        rejects.write(json.dumps({'line': line_number, 'row': row, 'errors': errors}, default=str) + '\n')
+
+    def write(self, loaded):
+        # Rows carrying an id go first, so ids line up with loaded below.
+        loaded = [item for item in loaded if 'id' in item[0]] + \
+                 [item for item in loaded if 'id' not in item[0]]
+        rows = [values for values, _ in loaded]
+        dialect = self.session.connection().dialect.name
+
+        with_ids = [values for values in rows if 'id' in values]
+        without_ids = [values for values in rows if 'id' not in values]
+
+        ids = []
+        if with_ids:
+            ids += self.upsert(with_ids, dialect)
+            self.explicit_ids = True
+        if without_ids:
+            if self.use_copy and self.association is None and dialect == 'postgresql':
+                self.copy(without_ids)
+            else:
+                ids += self.insert(without_ids, dialect)
+
+        if self.association is not None:
+            self.link_genres(ids, [genres for _, genres in loaded])
+
+        if self.after_batch is not None:
+            self.after_batch(rows, ids)
+
+    def upsert(self, rows, dialect):
+        if dialect == 'postgresql':
+            statement = postgresql.insert(self.table).values(rows)
+            statement = statement.on_conflict_do_update(
+                index_elements=[self.table.c.id],
+                set_={key: statement.excluded[key] for key in rows[0] if key != 'id'}
+            )
+            self.session.execute(statement)
+        else:
+            ids = [values['id'] for values in rows]
+            existing = {id for (id,) in self.session.execute(
+                self.table.select().with_only_columns([self.table.c.id]).where(self.table.c.id.in_(ids))
+            )}
+            for values in rows:
+                if values['id'] in existing:
+                    self.session.execute(
+                        self.table.update().where(self.table.c.id == values['id']).values(values)
+                    )
+                else:
+                    self.session.execute(insert(self.table), values)
+        return [values['id'] for values in rows]
+
+    def insert(self, rows, dialect):
+        if dialect == 'postgresql':
+            # PostgreSQL returns the ids of a multi-row INSERT in VALUES order.
+            result = self.session.execute(
+                insert(self.table).values(rows).returning(self.table.c.id)
+            )
+            return [row.id for row in result]
+        return [
+            self.session.execute(insert(self.table), values).inserted_primary_key[0]
+            for values in rows
+        ]
+
+    def copy(self, rows):
+        columns = list(rows[0])
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for values in rows:
+            writer.writerow(['' if values[column] is None else values[column] for column in columns])
+        buffer.seek(0)
+
+        column_list = ', '.join(f'"{column}"' for column in columns)
+        cursor = self.session.connection().connection.cursor()
+        try:
+            cursor.copy_expert(f'COPY "{self.table.name}" ({column_list}) FROM STDIN WITH (FORMAT csv)', buffer)
+        finally:
+            cursor.close()
+
+    def link_genres(self, ids, genres):
+        # Replaces the genres of the loaded rows.
+        owner = self.association.c[self.owner_key]
+        self.session.execute(self.association.delete().where(owner.in_(ids)))
+
+        by_name = {}
+        for genre in self.genres_named(sorted({name for names in genres for name in names})):
+            self.session.add(genre)
+            by_name[genre.name] = genre
+        self.session.flush()
+
+        links = [
+            {'genre_id': by_name[name].id, self.owner_key: owner_id}
+            for owner_id, names in zip(ids, genres)
+            for name in dict.fromkeys(names)
+        ]
+        if links:
+            self.session.execute(insert(self.association), links)
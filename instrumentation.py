@@ -0,0 +1,105 @@
+#----------------------------------------------------------------------------#
+# Per-request SQL statistics.
+#
+# Every statement run while handling a request is counted and timed, and
+# grouped by its shape (the SQL with literals and IN lists folded away).
+# The same shape running more than SQL_REPEAT_THRESHOLD times in one
+# request is the signature of an N+1 loop: it is logged, and raised as an
+# error when TESTING so the test that introduced it fails. In debug mode
+# the totals are added to the response headers.
+#----------------------------------------------------------------------------#
+
+import re
+import time
+from collections import Counter
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_LISTS = re.compile(r'\(\s*(?:\?|%\([^)]*\)s|%s|:\w+)(?:\s*,\s*(?:\?|%\([^)]*\)s|%s|:\w+))*\s*\)')
+_SPACES = re.compile(r'\s+')
+
+
+class RepeatedQueryError(AssertionError):
+    pass
+
+
+def fingerprint(statement):
+    statement = _LITERALS.sub('?', statement)
+    statement = _LISTS.sub('(...)', statement)
+    return _SPACES.sub(' ', statement).strip()
+
+
+class QueryStats:
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.shapes = Counter()
+
+    def record(self, statement, seconds):
+        self.count += 1
+        self.seconds += seconds
+        shape = fingerprint(statement)
+        self.shapes[shape] += 1
+        return shape, self.shapes[shape]
+
+    def most_repeated(self):
+        return self.shapes.most_common(1)[0] if self.shapes else (None, 0)
+
+
+def current_stats():
+    # Statistics of the request being handled, or None outside a request.
+    if has_request_context():
+        return g.get('sql_stats')
+    return None
+
+
+class SQLInstrumentation:
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.config.setdefault('SQL_REPEAT_THRESHOLD', 10)
+        # On the Engine class, so the replica engines created later are
+        # covered too.
+        event.listen(Engine, 'before_cursor_execute', self._before_execute)
+        event.listen(Engine, 'after_cursor_execute', self._after_execute)
+        app.before_request(self._start)
+        app.after_request(self._finish)
+
+    def _start(self):
+        g.sql_stats = QueryStats()
+
+    def _before_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._query_started = time.perf_counter()
+
+    def _after_execute(self, conn, cursor, statement, parameters, context, executemany):
+        stats = current_stats()
+        started = getattr(context, '_query_started', None)
+        if stats is None or started is None:
+            return
+
+        shape, times = stats.record(statement, time.perf_counter() - started)
+        threshold = self.app.config['SQL_REPEAT_THRESHOLD']
+        if threshold and times == threshold + 1:
+            message = f'{request.endpoint}: the same query ran more than {threshold} times ' \
+                      f'in one request (N+1?): {shape[:300]}'
+            if self.app.config.get('TESTING'):
+                raise RepeatedQueryError(message)
+            self.app.logger.warning(message)
+
+    def _finish(self, response):
+        stats = current_stats()
+        if stats is not None and self.app.debug:
+            shape, times = stats.most_repeated()
+            response.headers['X-Query-Count'] = str(stats.count)
+            response.headers['X-Query-Time-Ms'] = f'{stats.seconds * 1000:.1f}'
+            response.headers['X-Query-Max-Repeats'] = str(times)
+        return response
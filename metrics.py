@@ -0,0 +1,322 @@
+#----------------------------------------------------------------------------#
+# Prometheus metrics.
+#
+# Each worker process counts into its own in-memory registry. With
+# METRICS_DIR set, workers also write their registry to a file of their own
+# in that directory (at most once per flush interval, and at exit), and
+# /metrics adds up every file there, so whichever worker answers the scrape
+# reports the totals of all of them. A file is named after its process's
+# pid and start time, so a new worker that reuses a pid starts a file of its
+# own instead of overwriting (and so taking back) an old one. When /metrics
+# finds files of workers that have exited, it adds them into
+# metrics-archive.json and deletes them, so counters never go backwards and
+# the files do not pile up. Without METRICS_DIR each process reports only
+# itself.
+#----------------------------------------------------------------------------#
+
+import atexit
+import errno
+import glob
+import json
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows: dead workers' files are kept, not archived.
+    fcntl = None
+
+from flask import g, request
+from jinja2 import Template
+
+# Seconds; suits page latencies from a few milliseconds to several seconds.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _add(totals, snapshot):
+    # Adds a snapshot ({name: [[label values, value], ...]}) into totals
+    # ({name: {label values: value}}), skipping unknown metrics if totals
+    # is restricted to known ones.
+    for name, series in snapshot.items():
+        values = totals.get(name)
+        if values is None:
+            continue
+        for key, value in series:
+            key = tuple(key)
+            if isinstance(value, list):
+                current = values.get(key, [0] * len(value))
+                values[key] = [a + b for a, b in zip(current, value)]
+            else:
+                values[key] = values.get(key, 0) + value
+
+
+def _read(path):
+    try:
+        with open(path) as snapshot:
+            return json.load(snapshot)
+    except (OSError, ValueError):
+        return None
+
+
+def _write(path, data):
+    # Renamed into place so a reader never sees half a file.
+    temporary = f'{path}.{os.getpid()}.tmp'
+    with open(temporary, 'w') as snapshot:
+        json.dump(data, snapshot)
+    os.replace(temporary, path)
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError as error:
+        return error.errno == errno.EPERM
+    return True
+
+
+class Registry:
+
+    def __init__(self, directory=None, flush_interval=1.0):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        # name -> (type, help, label names, buckets)
+        self._metrics = {}
+        # name -> {label values: count}, or for histograms
+        # name -> {label values: [bucket counts..., sum, count]}
+        self._values = {}
+        self._lock = threading.Lock()
+        self._flushed_at = 0.0
+        # Set per process, see _path().
+        self._pid = None
+        self._started = None
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            atexit.register(self.flush, force=True)
+
+    def counter(self, name, help, labels=()):
+        self._metrics[name] = ('counter', help, tuple(labels), None)
+        self._values[name] = {}
+
+    def histogram(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        self._metrics[name] = ('histogram', help, tuple(labels), tuple(buckets))
+        self._values[name] = {}
+
+    def inc(self, name, labels=(), amount=1):
+        key = tuple(str(label) for label in labels)
+        with self._lock:
+            values = self._values[name]
+            values[key] = values.get(key, 0) + amount
+
+    def observe(self, name, labels, value):
+        buckets = self._metrics[name][3]
+        key = tuple(str(label) for label in labels)
+        with self._lock:
+            series = self._values[name].get(key)
+            if series is None:
+                series = self._values[name][key] = [0] * (len(buckets) + 2)
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    def _snapshot(self):
+        with self._lock:
+            return {
+                name: [[list(key), value if not isinstance(value, list) else list(value)]
+                       for key, value in values.items()]
+                for name, values in self._values.items()
+            }
+
+    def _path(self):
+        # This process's file. The registry may have been created before the
+        # server forked its workers, so the pid is checked on every call.
+        pid = os.getpid()
+        if pid != self._pid:
+            self._pid, self._started = pid, time.time_ns()
+        return os.path.join(self.directory, f'metrics-{pid}-{self._started}.json')
+
+    def flush(self, force=False):
+        # Writes this process's registry for the others to read.
+        if not self.directory:
+            return
+        now = time.monotonic()
+        if not force and now - self._flushed_at < self.flush_interval:
+            return
+        self._flushed_at = now
+        _write(self._path(), self._snapshot())
+
+    def _archive(self, archive):
+        # Adds the files of workers that have exited into archive and deletes
+        # them. The archive lists the files it holds, so a file is never
+        # counted twice, even if deleting it failed.
+        archived = set(archive['files'])
+        paths = glob.glob(os.path.join(self.directory, 'metrics-*-*.json'))
+        dead = [path for path in paths if os.path.basename(path) not in archived
+                and not _alive(int(os.path.basename(path).split('-')[1]))]
+        if not dead:
+            return archive
+
+        totals = {name: {} for name in archive['metrics']}
+        _add(totals, archive['metrics'])
+        for path in dead:
+            snapshot = _read(path) or {}
+            for name in snapshot:
+                totals.setdefault(name, {})
+            _add(totals, snapshot)
+            archived.add(os.path.basename(path))
+        archive = {
+            'files': sorted(archived & {os.path.basename(path) for path in paths}),
+            'metrics': {name: [[list(key), value] for key, value in values.items()]
+                        for name, values in totals.items()},
+        }
+        _write(os.path.join(self.directory, 'metrics-archive.json'), archive)
+        for path in dead:
+            os.remove(path)
+        return archive
+
+    def collect(self):
+        # name -> {label values: value}, summed over every process.
+        totals = {name: {} for name in self._metrics}
+        _add(totals, self._snapshot())
+        if not self.directory:
+            return totals
+
+        # Under the lock, so the archive and the files read agree even while
+        # another process is archiving.
+        with open(os.path.join(self.directory, 'metrics.lock'), 'w') as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            archive = _read(os.path.join(self.directory, 'metrics-archive.json')) \
+                or {'files': [], 'metrics': {}}
+            if fcntl is not None:
+                archive = self._archive(archive)
+            archived = set(archive['files'])
+            _add(totals, archive['metrics'])
+            own = self._path()
+            for path in glob.glob(os.path.join(self.directory, 'metrics-*-*.json')):
+                if path == own or os.path.basename(path) in archived:
+                    continue
+                snapshot = _read(path)
+                if snapshot is not None:
+                    _add(totals, snapshot)
+        return totals
+
+    def render(self):
+        # The Prometheus text exposition format.
+        lines = []
+        for name, series in sorted(self.collect().items()):
+            kind, help, label_names, buckets = self._metrics[name]
+            lines.append(f'# HELP {name} {help}')
+            lines.append(f'# TYPE {name} {kind}')
+            for key, value in sorted(series.items()):
+                if kind == 'counter':
+                    lines.append(f'{name}{_labels(label_names, key)} {_number(value)}')
+                    continue
+                cumulative = 0
+                for bound, count in zip(buckets, value):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{_labels(label_names, key, [("le", bound)])} {cumulative}')
+                lines.append(f'{name}_bucket{_labels(label_names, key, [("le", "+Inf")])} {value[-1]}')
+                lines.append(f'{name}_sum{_labels(label_names, key)} {_number(value[-2])}')
+                lines.append(f'{name}_count{_labels(label_names, key)} {value[-1]}')
+        return '\n'.join(lines) + '\n'
+
+
+# The registry of this process, set up by init_app().
+registry = None
+
+
+def record_cache(cache, hit):
+    # For caches to report their hit rate.
+    if registry is not None:
+        registry.inc('fyyur_cache_requests_total', (cache, 'hit' if hit else 'miss'))
+
+
+class TimedTemplate(Template):
+    # Flask only signals template rendering through blinker, which is not a
+    # dependency here, so the timing is taken by the template itself.
+
+    def render(self, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return super().render(*args, **kwargs)
+        finally:
+            _observe_render(self.name, time.perf_counter() - started)
+
+    def generate(self, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            yield from super().generate(*args, **kwargs)
+        finally:
+            _observe_render(self.name, time.perf_counter() - started)
+
+
+def _observe_render(name, seconds):
+    if registry is not None:
+        registry.observe('fyyur_template_render_seconds', (name,), seconds)
+
+
+def init_app(app, query_stats=None):
+    # query_stats returns the SQL statistics of the current request
+    # (instrumentation.current_stats).
+    global registry
+    registry = Registry(app.config.get('METRICS_DIR'))
+    registry.counter('fyyur_http_requests_total', 'Requests handled.',
+                     ('endpoint', 'method', 'status'))
+    registry.histogram('fyyur_http_request_duration_seconds',
+                       'Time to build each response; for streamed pages, until the first byte.',
+                       ('endpoint',))
+    registry.counter('fyyur_db_queries_total', 'SQL statements run while handling requests.',
+                     ('endpoint',))
+    registry.counter('fyyur_db_seconds_total', 'Time spent in SQL while handling requests.',
+                     ('endpoint',))
+    registry.histogram('fyyur_template_render_seconds', 'Time to render each page template.',
+                       ('template',))
+    registry.counter('fyyur_cache_requests_total', 'Cache lookups by result.',
+                     ('cache', 'result'))
+
+    app.jinja_env.template_class = TimedTemplate
+
+    @app.before_request
+    def start_timer():
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def record_request(response):
+        started = g.get('request_started')
+        if started is None:
+            return response
+        # Unmatched URLs share one label, so scanners cannot blow up the
+        # number of series.
+        endpoint = request.endpoint or 'unmatched'
+        registry.inc('fyyur_http_requests_total', (endpoint, request.method, response.status_code))
+        registry.observe('fyyur_http_request_duration_seconds', (endpoint,),
+                         time.perf_counter() - started)
+
+        stats = query_stats() if query_stats is not None else None
+        if stats is not None:
+            registry.inc('fyyur_db_queries_total', (endpoint,), stats.count)
+            registry.inc('fyyur_db_seconds_total', (endpoint,), stats.seconds)
+
+        registry.flush()
+        return response
+
+    return registry
@@ -71,6 +71,12 @@ def run_migrations_online():
                 directives[:] = []
                 logger.info('No changes in schema detected.')
 
+    # The pg_trgm indexes exist only where the extension could be installed
+    # (see 8b2e4d6f1a3c), so the models leave them out; keep autogenerate
+    # from dropping them.
+    def include_object(object, name, type_, reflected, compare_to):
+        return not (type_ == 'index' and name.endswith('_trgm'))
+
     connectable = current_app.extensions['migrate'].db.get_engine()
 
     with connectable.connect() as connection:
@@ -78,6 +84,7 @@ def run_migrations_online():
             connection=connection,
             target_metadata=target_metadata,
             process_revision_directives=process_revision_directives,
+            include_object=include_object,
             **current_app.extensions['migrate'].configure_args
         )
 
@@ -0,0 +1,34 @@
+"""Add indexes for show partitioning and area grouping.
+
+Revision ID: 3f9a1c2d7b64
+Revises: e7df52c51220
+Create Date: 2026-10-18 09:12:40.118204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f9a1c2d7b64'
+down_revision = 'e7df52c51220'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction block, so
+    # the indexes are built in autocommit mode and do not lock out writes.
+    with op.get_context().autocommit_block():
+        op.create_index('ix_Show_venue_id_start_time', 'Show', ['venue_id', 'start_time'], unique=False, postgresql_concurrently=True)
+        op.create_index('ix_Show_artist_id_start_time', 'Show', ['artist_id', 'start_time'], unique=False, postgresql_concurrently=True)
+        op.create_index('ix_Show_start_time', 'Show', ['start_time'], unique=False, postgresql_concurrently=True)
+        op.create_index('ix_Venue_state_city', 'Venue', ['state', 'city'], unique=False, postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_Venue_state_city', table_name='Venue', postgresql_concurrently=True)
+        op.drop_index('ix_Show_start_time', table_name='Show', postgresql_concurrently=True)
+        op.drop_index('ix_Show_artist_id_start_time', table_name='Show', postgresql_concurrently=True)
+        op.drop_index('ix_Show_venue_id_start_time', table_name='Show', postgresql_concurrently=True)
@@ -0,0 +1,30 @@
+"""Record how far the show counters have been rolled.
+
+Revision ID: 4e8a1d6b2f70
+Revises: 6c1f8d3a9e42
+Create Date: 2026-10-18 20:41:07.552193
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4e8a1d6b2f70'
+down_revision = '6c1f8d3a9e42'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Left empty: the first `flask show-counters roll` recounts everything
+    # and records the mark.
+    op.create_table('ShowCounterRoll',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('rolled_until', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade():
+    op.drop_table('ShowCounterRoll')
@@ -0,0 +1,43 @@
+"""Add indexes backing the keyset-paginated listings.
+
+Revision ID: 5d8e2a7c4f19
+Revises: c41d7e9a2b58
+Create Date: 2026-10-18 13:48:02.615870
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5d8e2a7c4f19'
+down_revision = 'c41d7e9a2b58'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.get_context().autocommit_block():
+        op.create_index('ix_Venue_state_city_name_id', 'Venue', ['state', 'city', 'name', 'id'], unique=False, postgresql_concurrently=True)
+        op.create_index('ix_Venue_name_id', 'Venue', ['name', 'id'], unique=False, postgresql_concurrently=True)
+        op.create_index('ix_Venue_created_at_id', 'Venue', ['created_at', 'id'], unique=False, postgresql_concurrently=True)
+        op.create_index('ix_Artist_name_id', 'Artist', ['name', 'id'], unique=False, postgresql_concurrently=True)
+        op.create_index('ix_Artist_created_at_id', 'Artist', ['created_at', 'id'], unique=False, postgresql_concurrently=True)
+        op.create_index('ix_Show_start_time_id', 'Show', ['start_time', 'id'], unique=False, postgresql_concurrently=True)
+
+        # Covered by the wider indexes above.
+        op.drop_index('ix_Venue_state_city', table_name='Venue', postgresql_concurrently=True)
+        op.drop_index('ix_Show_start_time', table_name='Show', postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.create_index('ix_Show_start_time', 'Show', ['start_time'], unique=False, postgresql_concurrently=True)
+        op.create_index('ix_Venue_state_city', 'Venue', ['state', 'city'], unique=False, postgresql_concurrently=True)
+
+        op.drop_index('ix_Show_start_time_id', table_name='Show', postgresql_concurrently=True)
+        op.drop_index('ix_Artist_created_at_id', table_name='Artist', postgresql_concurrently=True)
+        op.drop_index('ix_Artist_name_id', table_name='Artist', postgresql_concurrently=True)
+        op.drop_index('ix_Venue_created_at_id', table_name='Venue', postgresql_concurrently=True)
+        op.drop_index('ix_Venue_name_id', table_name='Venue', postgresql_concurrently=True)
+        op.drop_index('ix_Venue_state_city_name_id', table_name='Venue', postgresql_concurrently=True)
@@ -0,0 +1,29 @@
+"""Add updated_at to Venue, Artist and Show.
+
+Revision ID: 6c1f8d3a9e42
+Revises: e2b7f4a9c813
+Create Date: 2026-10-18 19:02:15.318406
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6c1f8d3a9e42'
+down_revision = 'e2b7f4a9c813'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # now() is stable within the statement, so PostgreSQL stores the
+    # default once instead of rewriting the tables; rows written outside
+    # the ORM (bulk COPY) keep getting it.
+    for table in ('Venue', 'Artist', 'Show'):
+        op.add_column(table, sa.Column('updated_at', sa.DateTime(), server_default=sa.func.now(), nullable=False))
+
+
+def downgrade():
+    for table in ('Show', 'Artist', 'Venue'):
+        op.drop_column(table, 'updated_at')
@@ -0,0 +1,67 @@
+"""Add pg_trgm indexes for venue and artist search.
+
+Revision ID: 8b2e4d6f1a3c
+Revises: 3f9a1c2d7b64
+Create Date: 2026-10-18 10:03:17.442981
+
+"""
+import logging
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8b2e4d6f1a3c'
+down_revision = '3f9a1c2d7b64'
+branch_labels = None
+depends_on = None
+
+TRIGRAM_INDEXES = [
+    ('ix_Venue_name_trgm', 'Venue', 'name'),
+    ('ix_Venue_city_trgm', 'Venue', 'city'),
+    ('ix_Venue_state_trgm', 'Venue', 'state'),
+    ('ix_Artist_name_trgm', 'Artist', 'name'),
+    ('ix_Artist_city_trgm', 'Artist', 'city'),
+    ('ix_Artist_state_trgm', 'Artist', 'state'),
+]
+
+
+logger = logging.getLogger('alembic.runtime.migration')
+
+
+def install_trigram(connection):
+    # Whether pg_trgm is, or could be, installed. Without it (not shipped
+    # with the server, or a role that may not create extensions) the indexes
+    # are skipped and search keeps using plain ILIKE.
+    if connection.execute(sa.text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")).first():
+        return True
+    if not connection.execute(sa.text("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")).first():
+        logger.warning('pg_trgm is not available on this server; skipping the trigram search indexes.')
+        return False
+    try:
+        with connection.begin_nested():
+            connection.execute(sa.text('CREATE EXTENSION IF NOT EXISTS pg_trgm'))
+    except sa.exc.DBAPIError as error:
+        logger.warning('Could not create the pg_trgm extension (%s); skipping the trigram search indexes.',
+                       error.orig)
+        return False
+    return True
+
+
+def upgrade():
+    if not install_trigram(op.get_bind()):
+        return
+
+    with op.get_context().autocommit_block():
+        for name, table, column in TRIGRAM_INDEXES:
+            op.create_index(name, table, [column], unique=False, postgresql_using='gin', postgresql_ops={column: 'gin_trgm_ops'}, postgresql_concurrently=True)
+
+
+def downgrade():
+    # The indexes may have been skipped on upgrade.
+    with op.get_context().autocommit_block():
+        for name, table, column in reversed(TRIGRAM_INDEXES):
+            op.execute(f'DROP INDEX CONCURRENTLY IF EXISTS "{name}"')
+
+    # The extension is left installed; other database objects may use it.
@@ -0,0 +1,43 @@
+"""Add denormalized show counters to Venue and Artist.
+
+Revision ID: 9a6c3e1f5b27
+Revises: 5d8e2a7c4f19
+Create Date: 2026-10-18 15:20:44.093128
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9a6c3e1f5b27'
+down_revision = '5d8e2a7c4f19'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table in ('Venue', 'Artist'):
+        op.add_column(table, sa.Column('upcoming_shows_count', sa.Integer(), server_default='0', nullable=False))
+        op.add_column(table, sa.Column('past_shows_count', sa.Integer(), server_default='0', nullable=False))
+
+    # Backfill from the existing shows; afterwards the application and
+    # `flask show-counters roll` keep the counts current.
+    for table, foreign_key in (('Venue', 'venue_id'), ('Artist', 'artist_id')):
+        op.execute(f"""
+            UPDATE "{table}" SET
+                upcoming_shows_count = (
+                    SELECT count(*) FROM "Show"
+                    WHERE "Show".{foreign_key} = "{table}".id AND "Show".start_time > now()
+                ),
+                past_shows_count = (
+                    SELECT count(*) FROM "Show"
+                    WHERE "Show".{foreign_key} = "{table}".id AND "Show".start_time <= now()
+                )
+        """)
+
+
+def downgrade():
+    for table in ('Artist', 'Venue'):
+        op.drop_column(table, 'past_shows_count')
+        op.drop_column(table, 'upcoming_shows_count')
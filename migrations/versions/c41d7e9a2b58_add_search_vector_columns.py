@@ -0,0 +1,102 @@
+"""Add trigger-maintained search_vector columns to Venue and Artist.
+
+Revision ID: c41d7e9a2b58
+Revises: 8b2e4d6f1a3c
+Create Date: 2026-10-18 11:26:54.730312
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'c41d7e9a2b58'
+down_revision = '8b2e4d6f1a3c'
+branch_labels = None
+depends_on = None
+
+# Names weigh the most, then places and genres, then the free-text blurb.
+VENUE_DOCUMENT = """
+    setweight(to_tsvector('simple', coalesce(NEW.name, '')), 'A') ||
+    setweight(to_tsvector('simple', coalesce(NEW.city, '') || ' ' || coalesce(NEW.state, '')), 'B') ||
+    setweight(to_tsvector('simple', coalesce(NEW.seeking_description, '')), 'C')
+"""
+
+ARTIST_DOCUMENT = """
+    setweight(to_tsvector('simple', coalesce(NEW.name, '')), 'A') ||
+    setweight(to_tsvector('simple', coalesce(NEW.city, '') || ' ' || coalesce(NEW.state, '')), 'B') ||
+    setweight(to_tsvector('simple', replace(coalesce(NEW.genres, ''), ',', ' ')), 'B') ||
+    setweight(to_tsvector('simple', coalesce(NEW.seeking_description, '')), 'C')
+"""
+
+
+# Rows touched in id ranges of this size when the documents are filled in.
+BATCH_SIZE = 5000
+
+# Columns whose update recomputes the document. search_vector itself is one,
+# so setting it (to anything) refreshes a row; the backfill below does that.
+# Other updates, such as of the show counters, leave the document alone.
+VENUE_COLUMNS = ('name', 'city', 'state', 'seeking_description', 'search_vector')
+ARTIST_COLUMNS = ('name', 'city', 'state', 'genres', 'seeking_description', 'search_vector')
+
+
+def create_search_trigger(table, document, columns):
+    function = f'{table.lower()}_search_vector_update'
+    op.execute(f"""
+        CREATE OR REPLACE FUNCTION {function}() RETURNS trigger AS $$
+        BEGIN
+            NEW.search_vector := {document};
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute(f"""
+        CREATE TRIGGER {function}
+        BEFORE INSERT OR UPDATE OF {', '.join(columns)} ON "{table}"
+        FOR EACH ROW EXECUTE PROCEDURE {function}()
+    """)
+
+
+def drop_search_trigger(table):
+    function = f'{table.lower()}_search_vector_update'
+    op.execute(f'DROP TRIGGER IF EXISTS {function} ON "{table}"')
+    op.execute(f'DROP FUNCTION IF EXISTS {function}()')
+
+
+def refresh_search_vectors(table):
+    # Each batch commits on its own, so a live table is never locked, or
+    # rewritten, as a whole.
+    with op.get_context().autocommit_block():
+        last = op.get_bind().execute(sa.text(f'SELECT max(id) FROM "{table}"')).scalar() or 0
+        for start in range(0, last, BATCH_SIZE):
+            op.execute(f'UPDATE "{table}" SET search_vector = NULL '
+                       f'WHERE id > {start} AND id <= {start + BATCH_SIZE}')
+
+
+def upgrade():
+    op.add_column('Venue', sa.Column('search_vector', postgresql.TSVECTOR(), nullable=True))
+    op.add_column('Artist', sa.Column('search_vector', postgresql.TSVECTOR(), nullable=True))
+
+    create_search_trigger('Venue', VENUE_DOCUMENT, VENUE_COLUMNS)
+    create_search_trigger('Artist', ARTIST_DOCUMENT, ARTIST_COLUMNS)
+
+    # The triggers fill in the documents of the existing rows.
+    refresh_search_vectors('Venue')
+    refresh_search_vectors('Artist')
+
+    with op.get_context().autocommit_block():
+        op.create_index('ix_Venue_search_vector', 'Venue', ['search_vector'], unique=False, postgresql_using='gin', postgresql_concurrently=True)
+        op.create_index('ix_Artist_search_vector', 'Artist', ['search_vector'], unique=False, postgresql_using='gin', postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_Artist_search_vector', table_name='Artist', postgresql_concurrently=True)
+        op.drop_index('ix_Venue_search_vector', table_name='Venue', postgresql_concurrently=True)
+
+    drop_search_trigger('Artist')
+    drop_search_trigger('Venue')
+
+    op.drop_column('Artist', 'search_vector')
+    op.drop_column('Venue', 'search_vector')
@@ -0,0 +1,198 @@
+"""Move genres into a Genre table with Venue/Artist association tables.
+
+Revision ID: e2b7f4a9c813
+Revises: 9a6c3e1f5b27
+Create Date: 2026-10-18 16:37:29.557401
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e2b7f4a9c813'
+down_revision = '9a6c3e1f5b27'
+branch_labels = None
+depends_on = None
+
+
+# Rows updated in id ranges of this size when documents are refreshed.
+BATCH_SIZE = 5000
+
+# Columns whose update recomputes the document (see c41d7e9a2b58): Artist
+# loses genres, whose changes now reach it through the touch triggers below.
+ARTIST_COLUMNS = ('name', 'city', 'state', 'seeking_description', 'search_vector')
+OLD_ARTIST_COLUMNS = ('name', 'city', 'state', 'genres', 'seeking_description', 'search_vector')
+
+
+def genre_names(association, foreign_key):
+    return f"""(
+        SELECT string_agg("Genre".name, ' ')
+        FROM "{association}" JOIN "Genre" ON "Genre".id = "{association}".genre_id
+        WHERE "{association}".{foreign_key} = NEW.id
+    )"""
+
+
+# The search documents now read genres from the association tables.
+VENUE_DOCUMENT = f"""
+    setweight(to_tsvector('simple', coalesce(NEW.name, '')), 'A') ||
+    setweight(to_tsvector('simple', coalesce(NEW.city, '') || ' ' || coalesce(NEW.state, '')), 'B') ||
+    setweight(to_tsvector('simple', coalesce({genre_names('VenueGenre', 'venue_id')}, '')), 'B') ||
+    setweight(to_tsvector('simple', coalesce(NEW.seeking_description, '')), 'C')
+"""
+
+ARTIST_DOCUMENT = f"""
+    setweight(to_tsvector('simple', coalesce(NEW.name, '')), 'A') ||
+    setweight(to_tsvector('simple', coalesce(NEW.city, '') || ' ' || coalesce(NEW.state, '')), 'B') ||
+    setweight(to_tsvector('simple', coalesce({genre_names('ArtistGenre', 'artist_id')}, '')), 'B') ||
+    setweight(to_tsvector('simple', coalesce(NEW.seeking_description, '')), 'C')
+"""
+
+# Documents of the previous revision, restored on downgrade.
+OLD_VENUE_DOCUMENT = """
+    setweight(to_tsvector('simple', coalesce(NEW.name, '')), 'A') ||
+    setweight(to_tsvector('simple', coalesce(NEW.city, '') || ' ' || coalesce(NEW.state, '')), 'B') ||
+    setweight(to_tsvector('simple', coalesce(NEW.seeking_description, '')), 'C')
+"""
+
+OLD_ARTIST_DOCUMENT = """
+    setweight(to_tsvector('simple', coalesce(NEW.name, '')), 'A') ||
+    setweight(to_tsvector('simple', coalesce(NEW.city, '') || ' ' || coalesce(NEW.state, '')), 'B') ||
+    setweight(to_tsvector('simple', replace(coalesce(NEW.genres, ''), ',', ' ')), 'B') ||
+    setweight(to_tsvector('simple', coalesce(NEW.seeking_description, '')), 'C')
+"""
+
+
+def replace_search_document(table, document):
+    op.execute(f"""
+        CREATE OR REPLACE FUNCTION {table.lower()}_search_vector_update() RETURNS trigger AS $$
+        BEGIN
+            NEW.search_vector := {document};
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+
+
+def replace_search_trigger(table, columns):
+    function = f'{table.lower()}_search_vector_update'
+    op.execute(f'DROP TRIGGER IF EXISTS {function} ON "{table}"')
+    op.execute(f"""
+        CREATE TRIGGER {function}
+        BEFORE INSERT OR UPDATE OF {', '.join(columns)} ON "{table}"
+        FOR EACH ROW EXECUTE PROCEDURE {function}()
+    """)
+
+
+def update_in_batches(table, assignment):
+    # Each batch commits on its own, so a live table is never locked, or
+    # rewritten, as a whole.
+    with op.get_context().autocommit_block():
+        last = op.get_bind().execute(sa.text(f'SELECT max(id) FROM "{table}"')).scalar() or 0
+        for start in range(0, last, BATCH_SIZE):
+            op.execute(f'UPDATE "{table}" SET {assignment} '
+                       f'WHERE id > {start} AND id <= {start + BATCH_SIZE}')
+
+
+def create_touch_trigger(association, table, foreign_key):
+    # Genres are linked after their venue/artist row is written, so changes
+    # to the association touch the owner row's search_vector, which makes
+    # its trigger compute the document again.
+    function = f'{association.lower()}_touch_owner'
+    op.execute(f"""
+        CREATE OR REPLACE FUNCTION {function}() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'DELETE' THEN
+                UPDATE "{table}" SET search_vector = NULL WHERE id = OLD.{foreign_key};
+                RETURN OLD;
+            END IF;
+            UPDATE "{table}" SET search_vector = NULL WHERE id = NEW.{foreign_key};
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute(f"""
+        CREATE TRIGGER {function}
+        AFTER INSERT OR DELETE ON "{association}"
+        FOR EACH ROW EXECUTE PROCEDURE {function}()
+    """)
+
+
+def drop_touch_trigger(association):
+    function = f'{association.lower()}_touch_owner'
+    op.execute(f'DROP TRIGGER IF EXISTS {function} ON "{association}"')
+    op.execute(f'DROP FUNCTION IF EXISTS {function}()')
+
+
+def upgrade():
+    op.create_table('Genre',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=120), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('name')
+    )
+    op.create_table('VenueGenre',
+    sa.Column('genre_id', sa.Integer(), nullable=False),
+    sa.Column('venue_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['genre_id'], ['Genre.id'], ),
+    sa.ForeignKeyConstraint(['venue_id'], ['Venue.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('genre_id', 'venue_id')
+    )
+    op.create_index('ix_VenueGenre_venue_id', 'VenueGenre', ['venue_id'], unique=False)
+    op.create_table('ArtistGenre',
+    sa.Column('genre_id', sa.Integer(), nullable=False),
+    sa.Column('artist_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['artist_id'], ['Artist.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['genre_id'], ['Genre.id'], ),
+    sa.PrimaryKeyConstraint('genre_id', 'artist_id')
+    )
+    op.create_index('ix_ArtistGenre_artist_id', 'ArtistGenre', ['artist_id'], unique=False)
+
+    # Backfill from the comma-joined Artist.genres strings. Venues never had
+    # a genres column, so there is nothing to carry over for them.
+    op.execute("""
+        INSERT INTO "Genre" (name)
+        SELECT DISTINCT trim(genre.name)
+        FROM "Artist" CROSS JOIN LATERAL unnest(string_to_array("Artist".genres, ',')) AS genre(name)
+        WHERE trim(genre.name) <> ''
+    """)
+    op.execute("""
+        INSERT INTO "ArtistGenre" (genre_id, artist_id)
+        SELECT DISTINCT "Genre".id, "Artist".id
+        FROM "Artist" CROSS JOIN LATERAL unnest(string_to_array("Artist".genres, ',')) AS genre(name)
+        JOIN "Genre" ON "Genre".name = trim(genre.name)
+    """)
+
+    replace_search_document('Venue', VENUE_DOCUMENT)
+    replace_search_document('Artist', ARTIST_DOCUMENT)
+    create_touch_trigger('VenueGenre', 'Venue', 'venue_id')
+    create_touch_trigger('ArtistGenre', 'Artist', 'artist_id')
+
+    # The trigger must stop naming the column before it can be dropped.
+    replace_search_trigger('Artist', ARTIST_COLUMNS)
+    op.drop_column('Artist', 'genres')
+    update_in_batches('Artist', 'search_vector = NULL')
+
+
+def downgrade():
+    op.add_column('Artist', sa.Column('genres', sa.String(length=120), nullable=True))
+    update_in_batches('Artist', """genres = (
+        SELECT string_agg("Genre".name, ',' ORDER BY "Genre".name)
+        FROM "ArtistGenre" JOIN "Genre" ON "Genre".id = "ArtistGenre".genre_id
+        WHERE "ArtistGenre".artist_id = "Artist".id
+    )""")
+
+    drop_touch_trigger('ArtistGenre')
+    drop_touch_trigger('VenueGenre')
+    replace_search_document('Artist', OLD_ARTIST_DOCUMENT)
+    replace_search_document('Venue', OLD_VENUE_DOCUMENT)
+    replace_search_trigger('Artist', OLD_ARTIST_COLUMNS)
+
+    op.drop_index('ix_ArtistGenre_artist_id', table_name='ArtistGenre')
+    op.drop_table('ArtistGenre')
+    op.drop_index('ix_VenueGenre_venue_id', table_name='VenueGenre')
+    op.drop_table('VenueGenre')
+    op.drop_table('Genre')
+
+    update_in_batches('Artist', 'search_vector = NULL')
+    update_in_batches('Venue', 'search_vector = NULL')
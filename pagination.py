@@ -0,0 +1,233 @@
+#----------------------------------------------------------------------------#
+# Keyset (cursor) pagination.
+#
+# A page is fetched with "WHERE (sort key) > (last key seen) ORDER BY sort
+# key LIMIT n" instead of an OFFSET, so every page costs the same index
+# range scan however deep into the listing it is. The sort key always ends
+# with a unique column (the id) so the order is total and stable.
+#
+# NULLs in a nullable sort column order as if larger than any value, as
+# PostgreSQL sorts them by default (so its indexes still serve the order),
+# and are compared explicitly, since "column > value" is never true of them.
+#----------------------------------------------------------------------------#
+
+import base64
+import binascii
+import json
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+from datetime import datetime
+
+from sqlalchemy import Integer, and_, column, false, or_
+
+# One column of a sort key: the attribute it is read back from on result
+# rows, the SQL expression to compare and order by, and its direction.
+SortKey = namedtuple('SortKey', 'name expression descending')
+
+
+class Page:
+
+    def __init__(self, items, next_cursor=None, prev_cursor=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+class StreamedPage(Page):
+    # A page whose rows are yielded as they come off the database cursor,
+    # for rendering while the query is still running. Its cursors are known
+    # once the rows have been read, which suits a pager placed below them.
+
+    def __init__(self, query, keys, per_page, has_previous):
+        super().__init__(None)
+        self._query = query
+        self._keys = keys
+        self._per_page = per_page
+        self._has_previous = has_previous
+
+    def __iter__(self):
+        first = last = None
+        count = 0
+        for row in self._query.yield_per(min(self._per_page + 1, 100)):
+            count += 1
+            if count > self._per_page:
+                self.next_cursor = encode_cursor(_key_of(self._keys, last))
+                break
+            if first is None:
+                first = row
+                if self._has_previous:
+                    self.prev_cursor = encode_cursor(_key_of(self._keys, first), backwards=True)
+            last = row
+            yield row
+
+    def __len__(self):
+        raise TypeError('a streamed page has no length until it has been read')
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {'dt': value.isoformat()}
+    return value
+
+
+def _decode_value(value):
+    if isinstance(value, dict):
+        return datetime.fromisoformat(value['dt'])
+    return value
+
+
+def encode_cursor(values, backwards=False):
+    payload = json.dumps([backwards, [_encode_value(value) for value in values]],
+                         separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def _nullable(key):
+    # Only table columns declared nullable; labels and functions are not.
+    expression = getattr(key.expression, 'expression', key.expression)
+    return bool(getattr(expression, 'nullable', False))
+
+
+def _accepts(key, value):
+    # Whether value is of the type key's column holds.
+    if value is None:
+        return _nullable(key)
+    if isinstance(value, bool):
+        return False
+    try:
+        expected = key.expression.type.python_type
+    except (AttributeError, NotImplementedError):
+        return isinstance(value, (str, int, float, datetime))
+    if expected is float:
+        return isinstance(value, (int, float))
+    return isinstance(value, expected)
+
+
+def decode_cursor(cursor, keys):
+    # The values and direction of a cursor for keys. Anything a client could
+    # have sent other than a cursor of ours is an InvalidCursor.
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        backwards, values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        if not isinstance(backwards, bool) or not isinstance(values, list) or len(values) != len(keys):
+            raise InvalidCursor(cursor)
+        values = [_decode_value(value) for value in values]
+    except (ValueError, TypeError, KeyError, binascii.Error):
+        raise InvalidCursor(cursor)
+    if not all(_accepts(key, value) for key, value in zip(keys, values)):
+        raise InvalidCursor(cursor)
+    return values, backwards
+
+
+def _beyond(key, value):
+    # Rows past value in key's column, NULL being past every value.
+    nullable = _nullable(key)
+    if value is None:
+        return key.expression.isnot(None) if key.descending else false()
+    if key.descending:
+        return key.expression < value
+    if nullable:
+        return or_(key.expression > value, key.expression.is_(None))
+    return key.expression > value
+
+
+def _equal(key, value):
+    if value is None:
+        return key.expression.is_(None)
+    return key.expression == value
+
+
+def after(keys, values):
+    # Rows strictly after values in the order described by keys. Expanded
+    # to (a > x) OR (a = x AND b > y) ... so that keys may mix directions.
+    clauses = []
+    for i, key in enumerate(keys):
+        equal = [_equal(keys[j], values[j]) for j in range(i)]
+        clauses.append(and_(*equal, _beyond(key, values[i])))
+    return or_(*clauses)
+
+
+def _ordering(key):
+    if key.descending:
+        ordering = key.expression.desc()
+        return ordering.nulls_first() if _nullable(key) else ordering
+    ordering = key.expression.asc()
+    return ordering.nulls_last() if _nullable(key) else ordering
+
+
+def _key_of(keys, row):
+    return [getattr(row, key.name) for key in keys]
+
+
+def paginate(query, keys, cursor=None, per_page=50, stream=False):
+    # With stream, forward pages come back as a StreamedPage; pages walked
+    # backwards are reversed after fetching, so they are always read whole.
+    if cursor:
+        values, backwards = decode_cursor(cursor, keys)
+    else:
+        values, backwards = None, False
+
+    # Walking backwards is walking forwards over the reversed order.
+    walk = [SortKey(key.name, key.expression, key.descending != backwards) for key in keys]
+    if values is not None:
+        query = query.filter(after(walk, values))
+    query = query.order_by(*[_ordering(key) for key in walk])
+
+    query = query.limit(per_page + 1)
+    if stream and not backwards:
+        return StreamedPage(query, keys, per_page, values is not None)
+
+    rows = query.all()
+    more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backwards:
+        rows.reverse()
+
+    next_cursor = prev_cursor = None
+    if rows:
+        if more or backwards:
+            next_cursor = encode_cursor(_key_of(keys, rows[-1]))
+        if (more and backwards) or (values is not None and not backwards):
+            prev_cursor = encode_cursor(_key_of(keys, rows[0]), backwards=True)
+
+    return Page(rows, next_cursor, prev_cursor)
+
+
+# The sort key of paginate_ids().
+ID_KEYS = [SortKey('id', column('id', Integer), False)]
+
+
+def paginate_ids(ids, cursor=None, per_page=50):
+    # Pages through a sorted list of ids held in memory, such as the matches
+    # of the in-process search index. The cursors are those of an [id] sort
+    # key, so pages link the same way as paginate()'s.
+    if cursor:
+        (last,), backwards = decode_cursor(cursor, ID_KEYS)
+    else:
+        last, backwards = None, False
+
+    if backwards:
+        end = bisect_left(ids, last)
+        start = max(0, end - per_page)
+    else:
+        start = bisect_right(ids, last) if last is not None else 0
+        end = min(len(ids), start + per_page)
+    items = ids[start:end]
+
+    next_cursor = prev_cursor = None
+    if items:
+        if end < len(ids):
+            next_cursor = encode_cursor([items[-1]])
+        if start > 0:
+            prev_cursor = encode_cursor([items[0]], backwards=True)
+    return Page(items, next_cursor, prev_cursor)
@@ -0,0 +1,156 @@
+#----------------------------------------------------------------------------#
+# On-demand request profiling.
+#
+# A request asks to be profiled with an X-Profile header or a ?profile=
+# argument. It is profiled when that value is the configured PROFILE_TOKEN,
+# or when it comes from an address in PROFILE_ALLOWLIST. A sampling thread
+# then records the request thread's stack every PROFILE_INTERVAL_MS while
+# the response is built. The samples are written to PROFILE_DIR as
+# collapsed stacks, one "frame;frame;... count" line per distinct stack, the
+# input format of flamegraph.pl and speedscope. The response reports the
+# file name and the share of samples spent in each of SQL, ORM loading,
+# format_datetime, Jinja rendering and everything else.
+#
+# The first frame of every stack is its category, so a flame graph splits
+# along the same lines.
+#----------------------------------------------------------------------------#
+
+import hmac
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+from flask import g, request
+
+CATEGORIES = ('sql', 'orm', 'format_datetime', 'jinja', 'app')
+
+_SQL_PATHS = (os.sep + os.path.join('sqlalchemy', 'engine') + os.sep,
+              os.sep + os.path.join('sqlalchemy', 'pool') + os.sep,
+              os.sep + 'psycopg2' + os.sep, os.sep + 'sqlite3' + os.sep)
+_ORM_PATH = os.sep + os.path.join('sqlalchemy', 'orm') + os.sep
+_JINJA_PATH = os.sep + 'jinja2' + os.sep
+
+
+def category(frame):
+    # The innermost frame that says what the time is being spent on: a
+    # lazy load fired from a template counts as SQL, babel formatting under
+    # format_datetime as format_datetime.
+    while frame is not None:
+        code = frame.f_code
+        filename = code.co_filename
+        if any(path in filename for path in _SQL_PATHS):
+            return 'sql'
+        if _ORM_PATH in filename:
+            return 'orm'
+        if code.co_name in ('format_datetime', 'format_datetimes'):
+            return 'format_datetime'
+        if _JINJA_PATH in filename or filename.endswith('.html'):
+            return 'jinja'
+        frame = frame.f_back
+    return 'app'
+
+
+def collapse(frame):
+    # The stack from Flask's dispatch down to frame, outermost first.
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+        if code.co_name == 'full_dispatch_request':
+            break
+        frame = frame.f_back
+    names.reverse()
+    return ';'.join(names)
+
+
+class Sampler(threading.Thread):
+
+    def __init__(self, thread_id, interval):
+        super().__init__(name='profiler', daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.categories = Counter()
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            kind = category(frame)
+            self.categories[kind] += 1
+            self.stacks[f'{kind};{collapse(frame)}'] += 1
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+
+    def folded(self):
+        return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
+
+    def summary(self):
+        total = sum(self.categories.values())
+        if not total:
+            return 'no samples'
+        return '; '.join(f'{kind}={100.0 * self.categories[kind] / total:.1f}%'
+                         for kind in CATEGORIES)
+
+
+class RequestProfiler:
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.config.setdefault('PROFILE_TOKEN', None)
+        app.config.setdefault('PROFILE_ALLOWLIST', [])
+        app.config.setdefault('PROFILE_DIR', os.path.join(app.root_path, 'profiles'))
+        app.config.setdefault('PROFILE_INTERVAL_MS', 2)
+        app.before_request(self._start)
+        app.after_request(self._finish)
+        app.teardown_request(self._stop)
+
+    def authorized(self):
+        asked = request.headers.get('X-Profile') or request.args.get('profile')
+        if not asked:
+            return False
+        token = self.app.config['PROFILE_TOKEN']
+        if token and hmac.compare_digest(asked.encode('utf-8'), token.encode('utf-8')):
+            return True
+        return request.remote_addr in self.app.config['PROFILE_ALLOWLIST']
+
+    def _start(self):
+        if not self.authorized():
+            return
+        sampler = Sampler(threading.get_ident(), self.app.config['PROFILE_INTERVAL_MS'] / 1000.0)
+        g.profiler = sampler
+        sampler.start()
+
+    def _finish(self, response):
+        sampler = g.pop('profiler', None)
+        if sampler is None:
+            return response
+        sampler.stop()
+
+        directory = self.app.config['PROFILE_DIR']
+        os.makedirs(directory, exist_ok=True)
+        now = time.time()
+        name = f'{time.strftime("%Y%m%d-%H%M%S", time.localtime(now))}.{int(now * 1000) % 1000:03d}' \
+               f'-{os.getpid()}-{request.endpoint or "unmatched"}.folded'
+        with open(os.path.join(directory, name), 'w') as profile:
+            profile.write(sampler.folded())
+
+        response.headers['X-Profile-File'] = name
+        response.headers['X-Profile-Summary'] = sampler.summary()
+        return response
+
+    def _stop(self, error=None):
+        # A request that failed before after_request still stops its thread.
+        sampler = g.pop('profiler', None)
+        if sampler is not None:
+            sampler.stop()
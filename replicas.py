@@ -0,0 +1,114 @@
+#----------------------------------------------------------------------------#
+# Read replica routing.
+#
+# Views marked with ReplicaRouter.read_only read from one of the replicas
+# configured as SQLALCHEMY_BINDS 'replica0', 'replica1', ... picked round
+# robin among those that are up. Everything else, and any write or flush
+# even inside a read-only view, goes to the primary. After a user writes,
+# their reads stay on the primary for a short window so they see their own
+# change before the replicas have caught up.
+#----------------------------------------------------------------------------#
+
+import threading
+import time
+from functools import wraps
+
+from flask import g, has_app_context, request, session
+from flask_sqlalchemy import SQLAlchemy, SignallingSession, get_state
+from sqlalchemy import orm
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.sql.dml import UpdateBase
+
+READ_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class RoutingSession(SignallingSession):
+
+    def get_bind(self, mapper=None, clause=None):
+        replica = g.get('db_replica') if has_app_context() else None
+        if replica is not None and not self._flushing and not isinstance(clause, UpdateBase):
+            return get_state(self.app).db.get_engine(self.app, bind=replica)
+        return super().get_bind(mapper, clause)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+
+class ReplicaSet:
+    # Round robin over the replicas, skipping one for retry_after seconds
+    # after it has failed.
+
+    def __init__(self, names, retry_after=30):
+        self.names = list(names)
+        self.retry_after = retry_after
+        self._down_until = {}
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def choose(self):
+        now = time.monotonic()
+        with self._lock:
+            for _ in range(len(self.names)):
+                name = self.names[self._next % len(self.names)]
+                self._next += 1
+                if self._down_until.get(name, 0) <= now:
+                    return name
+        return None
+
+    def mark_down(self, name):
+        with self._lock:
+            self._down_until[name] = time.monotonic() + self.retry_after
+
+    def status(self):
+        now = time.monotonic()
+        with self._lock:
+            return {name: self._down_until.get(name, 0) <= now for name in self.names}
+
+
+class ReplicaRouter:
+
+    def __init__(self, app=None, db=None):
+        self.replicas = ReplicaSet([])
+        self.db = db
+        if app is not None:
+            self.init_app(app, db)
+
+    def init_app(self, app, db):
+        self.db = db
+        names = sorted(name for name in app.config.get('SQLALCHEMY_BINDS') or {}
+                       if name.startswith('replica'))
+        self.replicas = ReplicaSet(names, app.config.get('REPLICA_RETRY_SECONDS', 30))
+        self.pin_seconds = app.config.get('READ_YOUR_WRITES_SECONDS', 10)
+        app.after_request(self._pin_after_write)
+
+    def pinned(self):
+        return session.get('_primary_until', 0) > time.time()
+
+    def _pin_after_write(self, response):
+        if self.replicas.names and request.method not in READ_METHODS \
+                and not g.get('db_read_only'):
+            session['_primary_until'] = time.time() + self.pin_seconds
+        return response
+
+    def read_only(self, view):
+        @wraps(view)
+        def read_only_view(*args, **kwargs):
+            g.db_read_only = True
+            replica = None if self.pinned() else self.replicas.choose()
+            if replica is None:
+                return view(*args, **kwargs)
+
+            g.db_replica = replica
+            try:
+                return view(*args, **kwargs)
+            except OperationalError:
+                # The replica went away under us: take it out of rotation
+                # and answer from the primary instead.
+                self.db.session.rollback()
+                self.replicas.mark_down(replica)
+                g.db_replica = None
+                return view(*args, **kwargs)
+        return read_only_view
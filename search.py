@@ -0,0 +1,117 @@
+#----------------------------------------------------------------------------#
+# Search helpers shared by the venue and artist search endpoints.
+#----------------------------------------------------------------------------#
+
+import re
+
+from sqlalchemy import func, or_, text, true, false
+
+from search_index import tokenize
+
+# Engines (keyed by URL) on which the pg_trgm extension is installed.
+_trigram_support = {}
+
+# (engine URL, table) pairs that carry a trigger-maintained search_vector.
+_fulltext_support = {}
+
+# Text search configuration used by the search_vector triggers; 'simple'
+# does not stem, which suits names and places.
+TS_CONFIG = 'simple'
+
+
+def escape_like(term):
+    # Keep user input from being read as LIKE wildcards.
+    return term.replace('!', '!!').replace('%', '!%').replace('_', '!_')
+
+
+def trigram_available(session):
+    connection = session.connection()
+    key = str(connection.engine.url)
+    if key not in _trigram_support:
+        supported = False
+        if connection.dialect.name == 'postgresql':
+            supported = connection.execute(text(
+                "SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'"
+            )).first() is not None
+        _trigram_support[key] = supported
+    return _trigram_support[key]
+
+
+def substring_search(session, columns, term):
+    # Returns a (criterion, rank) pair for a case-insensitive substring
+    # match of term against any of columns. On PostgreSQL with pg_trgm the
+    # ILIKE is served by the trigram GIN indexes and rank orders the best
+    # matches first; elsewhere rank is None and callers fall back to a plain
+    # ordering.
+    pattern = f"%{escape_like(term)}%"
+    criterion = or_(*[column.ilike(pattern, escape='!') for column in columns])
+
+    rank = None
+    if term and trigram_available(session):
+        rank = func.greatest(*[func.similarity(column, term) for column in columns])
+
+    return criterion, rank
+
+
+def fulltext_available(session, table):
+    connection = session.connection()
+    key = (str(connection.engine.url), table.name)
+    if key not in _fulltext_support:
+        supported = False
+        if connection.dialect.name == 'postgresql':
+            supported = connection.execute(text(
+                "SELECT 1 FROM information_schema.columns "
+                "WHERE table_name = :table AND column_name = 'search_vector'"
+            ), {'table': table.name}).first() is not None
+        _fulltext_support[key] = supported
+    return _fulltext_support[key]
+
+
+def fulltext_search(vector, term):
+    # Every word of the term has to match the start of a word in the
+    # document ("mus hop" finds "The Musical Hop"), and ts_rank orders
+    # the matches. Only word characters reach to_tsquery, so user input
+    # cannot inject tsquery operators.
+    words = re.findall(r'\w+', term.lower())
+    if not words:
+        return true(), None
+
+    query = func.to_tsquery(TS_CONFIG, ' & '.join(f'{word}:*' for word in words))
+    return vector.op('@@')(query), func.ts_rank(vector, query)
+
+
+def index_matches(index, model, term):
+    # Sorted ids of the model rows the in-process inverted index
+    # (search_index.py) finds for term, or None when term has no words and
+    # so matches every row.
+    if not tokenize(term):
+        return None
+    return sorted(index.search(model.__tablename__, term))
+
+
+def index_search(index, model, term):
+    # The index matches as a criterion, for queries that narrow them further
+    # in SQL; callers that can should page index_matches() themselves
+    # rather than send every id to the database.
+    ids = index_matches(index, model, term)
+    if ids is None:
+        return true(), None
+    if not ids:
+        return false(), None
+    return model.id.in_(ids), None
+
+
+def search_criteria(session, model, term, backend='auto', index=None):
+    # Picks the best search available for model: the in-process index when
+    # configured, the ranked full-text search when its search_vector column
+    # has been migrated in, otherwise substring matching on name, city and
+    # state.
+    if backend == 'index':
+        return index_search(index, model, term)
+
+    if backend == 'fulltext' or (
+        backend == 'auto' and fulltext_available(session, model.__table__)
+    ):
+        return fulltext_search(model.search_vector, term)
+
+    return substring_search(session, [model.name, model.city, model.state], term)
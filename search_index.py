@@ -0,0 +1,286 @@
+#----------------------------------------------------------------------------#
+# In-process inverted index for venue and artist search.
+#
+# Used where the database cannot do the work itself (SQLite, read-only
+# replicas without our extensions). The index is a read-only snapshot file
+# that is memory-mapped, so forked workers share its pages and serve their
+# first search without touching the database, plus a small in-memory
+# overlay holding the documents written since the snapshot was taken.
+#
+# Snapshot layout (all integers little-endian):
+#
+#   b'FYYURIX1' | uint32 section count
+#   per section: 16-byte kind name, uint32 term count, 4 x uint64 positions
+#                of the term offsets, term bytes, posting offsets and
+#                postings
+#
+# Terms are stored sorted by their UTF-8 bytes so prefixes can be found
+# with a binary search; postings are sorted uint32 document ids.
+#----------------------------------------------------------------------------#
+
+import mmap
+import os
+import re
+import struct
+import sys
+import threading
+import time
+from array import array
+
+MAGIC = b'FYYURIX1'
+SECTION = struct.Struct('<16sI4Q')
+COUNT = struct.Struct('<I')
+
+WORD_RE = re.compile(r'\w+')
+
+
+def tokenize(*fields):
+    terms = set()
+    for field in fields:
+        if field:
+            terms.update(WORD_RE.findall(field.lower()))
+    return terms
+
+
+def _uint32_bytes(values):
+    data = array('I', values)
+    if sys.byteorder != 'little':
+        data.byteswap()
+    return data.tobytes()
+
+
+def _uint32_view(buffer):
+    if sys.byteorder == 'little':
+        return buffer.cast('I')
+    data = array('I', buffer.tobytes())
+    data.byteswap()
+    return data
+
+
+def _align(position):
+    return (position + 3) & ~3
+
+
+class _Section:
+    # One kind of document ("Venue", "Artist") inside a mapped snapshot.
+
+    def __init__(self, buffer, term_count, positions):
+        terms_at, blob_at, postings_offsets_at, postings_at = positions
+        self.term_count = term_count
+        self.term_offsets = _uint32_view(buffer[terms_at:terms_at + 4 * (term_count + 1)])
+        self.blob = buffer[blob_at:postings_offsets_at]
+        self.posting_offsets = _uint32_view(buffer[postings_offsets_at:postings_offsets_at + 4 * (term_count + 1)])
+        self.postings = _uint32_view(buffer[postings_at:postings_at + 4 * self.posting_offsets[term_count]])
+
+    def term(self, i):
+        return bytes(self.blob[self.term_offsets[i]:self.term_offsets[i + 1]])
+
+    def ids(self, i):
+        return self.postings[self.posting_offsets[i]:self.posting_offsets[i + 1]]
+
+    def prefix_range(self, prefix):
+        low, high = 0, self.term_count
+        while low < high:
+            middle = (low + high) // 2
+            if self.term(middle) < prefix:
+                low = middle + 1
+            else:
+                high = middle
+        i = low
+        while i < self.term_count and self.term(i).startswith(prefix):
+            yield i
+            i += 1
+
+    def items(self):
+        for i in range(self.term_count):
+            yield self.term(i).decode('utf-8'), self.ids(i)
+
+
+class InvertedIndex:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._file = None
+        self._map = None
+        self._sections = {}
+        # Documents added since the snapshot: kind -> term -> ids, and
+        # kind -> id -> terms so a later edit can take them back out.
+        self._postings = {}
+        self._documents = {}
+        # Snapshot documents that were edited or deleted since.
+        self._stale = {}
+        # (kind, id) -> when the document was last added or removed here.
+        self._changed = {}
+
+    @classmethod
+    def load(cls, path):
+        index = cls()
+        index._file = open(path, 'rb')
+        index._map = mmap.mmap(index._file.fileno(), 0, access=mmap.ACCESS_READ)
+        buffer = memoryview(index._map)
+
+        if bytes(buffer[:len(MAGIC)]) != MAGIC:
+            buffer.release()
+            index.close()
+            raise ValueError(f'{path} is not a search index snapshot')
+
+        position = len(MAGIC)
+        (count,) = COUNT.unpack_from(buffer, position)
+        position += COUNT.size
+        for _ in range(count):
+            name, term_count, *positions = SECTION.unpack_from(buffer, position)
+            position += SECTION.size
+            kind = name.rstrip(b'\0').decode('ascii')
+            index._sections[kind] = _Section(buffer, term_count, positions)
+
+        return index
+
+    def close(self):
+        self._sections = {}
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def add(self, kind, doc_id, terms, at=None):
+        with self._lock:
+            self._discard(kind, doc_id, at)
+            documents = self._documents.setdefault(kind, {})
+            postings = self._postings.setdefault(kind, {})
+            documents[doc_id] = frozenset(terms)
+            for term in terms:
+                postings.setdefault(term, set()).add(doc_id)
+
+    def remove(self, kind, doc_id, at=None):
+        with self._lock:
+            self._discard(kind, doc_id, at)
+
+    def _discard(self, kind, doc_id, at=None):
+        self._changed[kind, doc_id] = time.time() if at is None else at
+        self._stale.setdefault(kind, set()).add(doc_id)
+        terms = self._documents.get(kind, {}).pop(doc_id, ())
+        postings = self._postings.get(kind, {})
+        for term in terms:
+            ids = postings.get(term)
+            if ids is not None:
+                ids.discard(doc_id)
+                if not ids:
+                    del postings[term]
+
+    def carry_over(self, previous, since):
+        # Applies the overlay changes of previous made after since, the time
+        # this index's snapshot read its data, so a reloaded index keeps the
+        # writes the snapshot does not have yet.
+        with previous._lock:
+            changes = [(kind, doc_id, previous._documents.get(kind, {}).get(doc_id), at)
+                       for (kind, doc_id), at in previous._changed.items() if at > since]
+        for kind, doc_id, terms, at in changes:
+            if terms is None:
+                self.remove(kind, doc_id, at)
+            else:
+                self.add(kind, doc_id, terms, at)
+
+    def search(self, kind, text):
+        # Ids of the documents in which every word of text starts a word,
+        # mirroring the prefix matching of the full-text search.
+        words = tokenize(text)
+        if not words:
+            return self.all_ids(kind)
+
+        result = None
+        for word in words:
+            ids = self._prefix_ids(kind, word)
+            result = ids if result is None else result & ids
+            if not result:
+                break
+        return result
+
+    def all_ids(self, kind):
+        ids = set()
+        section = self._sections.get(kind)
+        if section is not None:
+            ids.update(section.postings)
+        with self._lock:
+            ids -= self._stale.get(kind, set())
+            ids.update(self._documents.get(kind, {}))
+        return ids
+
+    def _prefix_ids(self, kind, word):
+        ids = set()
+        section = self._sections.get(kind)
+        if section is not None:
+            for i in section.prefix_range(word.encode('utf-8')):
+                ids.update(section.ids(i))
+
+        with self._lock:
+            ids -= self._stale.get(kind, set())
+            for term, term_ids in self._postings.get(kind, {}).items():
+                if term.startswith(word):
+                    ids |= term_ids
+        return ids
+
+    def merged(self):
+        # kind -> term -> sorted ids, combining the snapshot and overlay.
+        with self._lock:
+            merged = {}
+            for kind, section in self._sections.items():
+                stale = self._stale.get(kind, set())
+                terms = merged.setdefault(kind, {})
+                for term, ids in section.items():
+                    live = set(ids) - stale
+                    if live:
+                        terms[term] = live
+            for kind, postings in self._postings.items():
+                terms = merged.setdefault(kind, {})
+                for term, ids in postings.items():
+                    terms.setdefault(term, set()).update(ids)
+        return {
+            kind: {term: sorted(ids) for term, ids in terms.items()}
+            for kind, terms in merged.items()
+        }
+
+    def save(self, path):
+        # Written next to the target and renamed into place so running
+        # workers keep their mapping of the previous snapshot.
+        sections = []
+        for kind, postings in sorted(self.merged().items()):
+            terms = sorted(postings, key=lambda term: term.encode('utf-8'))
+            encoded = [term.encode('utf-8') for term in terms]
+
+            term_offsets, posting_offsets, ids = [0], [0], []
+            for term, raw in zip(terms, encoded):
+                term_offsets.append(term_offsets[-1] + len(raw))
+                ids.extend(postings[term])
+                posting_offsets.append(len(ids))
+
+            sections.append((kind, len(terms), [
+                _uint32_bytes(term_offsets),
+                b''.join(encoded),
+                _uint32_bytes(posting_offsets),
+                _uint32_bytes(ids),
+            ]))
+
+        position = len(MAGIC) + COUNT.size + SECTION.size * len(sections)
+        headers, chunks = [], []
+        for kind, term_count, parts in sections:
+            positions = []
+            for part in parts:
+                padding = _align(position) - position
+                chunks.append(b'\0' * padding)
+                position += padding
+                positions.append(position)
+                chunks.append(part)
+                position += len(part)
+            headers.append(SECTION.pack(kind.encode('ascii'), term_count, *positions))
+
+        temporary = f'{path}.{os.getpid()}.tmp'
+        with open(temporary, 'wb') as snapshot:
+            snapshot.write(MAGIC)
+            snapshot.write(COUNT.pack(len(sections)))
+            for header in headers:
+                snapshot.write(header)
+            for chunk in chunks:
+                snapshot.write(chunk)
+        os.replace(temporary, path)
@@ -0,0 +1,126 @@
+import pytest
+from flask import Flask, flash, render_template_string
+
+import cache
+from cache import FragmentCacheExtension, MemoryCache, NullCache, ResponseCache, TaggedCache, make_backend
+
+
+def test_memory_cache_evicts_least_recently_used():
+    backend = MemoryCache(max_entries=2)
+    backend.set('a', 1)
+    backend.set('b', 2)
+    assert backend.get('a') == 1
+    backend.set('c', 3)
+    assert backend.get('b') is None
+    assert backend.get('a') == 1 and backend.get('c') == 3
+
+
+def test_memory_cache_expires_entries(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache.time, 'monotonic', lambda: now[0])
+    backend = MemoryCache(default_ttl=60)
+    backend.set('short', 1, ttl=5)
+    backend.set('default', 2)
+    backend.set('forever', 3, ttl=0)
+    now[0] += 10
+    assert backend.get('short') is None
+    assert backend.get('default') == 2
+    now[0] += 100
+    assert backend.get('default') is None
+    assert backend.get('forever') == 3
+
+
+def shared_backend(config):
+    return MemoryCache(max_entries=config['SHARED_ENTRIES'])
+
+
+def test_make_backend():
+    assert isinstance(make_backend({'CACHE_BACKEND': 'memory'}), MemoryCache)
+    assert isinstance(make_backend({'CACHE_BACKEND': 'null'}), NullCache)
+    backend = make_backend({'CACHE_BACKEND': 'test_cache:shared_backend', 'SHARED_ENTRIES': 3})
+    assert backend.max_entries == 3
+
+
+def test_invalidating_a_tag_changes_the_keys_using_it():
+    tagged = TaggedCache(MemoryCache())
+    venues = tagged.key('response', '/venues', ['venues'])
+    shows = tagged.key('response', '/shows', ['shows', 'venues'])
+    artists = tagged.key('response', '/artists', ['artists'])
+    tagged.set(venues, 'venue page')
+
+    tagged.invalidate('venues')
+    assert tagged.key('response', '/venues', ['venues']) != venues
+    assert tagged.key('response', '/shows', ['shows', 'venues']) != shows
+    assert tagged.key('response', '/artists', ['artists']) == artists
+    assert tagged.get(tagged.key('response', '/venues', ['venues']), 'response') is None
+
+
+def test_evicted_version_only_causes_misses():
+    backend = MemoryCache()
+    tagged = TaggedCache(backend)
+    key = tagged.key('response', '/venues', ['venues'])
+    backend.delete('version:venues')
+    assert tagged.key('response', '/venues', ['venues']) != key
+
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+    app.secret_key = 'test'
+    response_cache = ResponseCache(app)
+    app.extensions['calls'] = calls = []
+
+    @app.route('/venues')
+    @response_cache.cached('venues')
+    def venues():
+        calls.append('venues')
+        return f'venues {len(calls)}'
+
+    @app.route('/venues/create', methods=['POST'])
+    def create_venue():
+        response_cache.invalidate('venues')
+        return 'created'
+
+    @app.route('/flash')
+    def flashing():
+        flash('hello')
+        return 'flashed'
+
+    return app
+
+
+def test_responses_are_cached_until_invalidated(app):
+    client = app.test_client()
+    assert client.get('/venues').data == b'venues 1'
+    assert client.get('/venues').data == b'venues 1'
+
+    app.test_client().post('/venues/create')
+    assert client.get('/venues').data == b'venues 2'
+    assert app.extensions['calls'] == ['venues', 'venues']
+
+
+def test_the_writer_skips_the_cache_for_a_while(app):
+    client = app.test_client()
+    client.get('/venues')
+    client.post('/venues/create')
+    assert client.get('/venues').data == b'venues 2'
+    assert client.get('/venues').data == b'venues 3'
+
+
+def test_pending_flashes_skip_the_cache(app):
+    client = app.test_client()
+    client.get('/venues')
+    client.get('/flash')
+    assert client.get('/venues').data == b'venues 2'
+
+
+def test_fragment_cache():
+    app = Flask(__name__)
+    app.jinja_env.add_extension(FragmentCacheExtension)
+    template = '{% cache [tile.id, tile.version] %}{{ tile.name }}{% endcache %}'
+    with app.app_context():
+        assert render_template_string(template, tile={'id': 1, 'version': 'a', 'name': 'Hop'}) == 'Hop'
+        app.jinja_env.fragment_cache = TaggedCache(MemoryCache())
+        assert render_template_string(template, tile={'id': 1, 'version': 'a', 'name': 'Hop'}) == 'Hop'
+        assert render_template_string(template, tile={'id': 1, 'version': 'a', 'name': 'Changed'}) == 'Hop'
+        assert render_template_string(template, tile={'id': 1, 'version': 'b', 'name': 'Changed'}) == 'Changed'
@@ -0,0 +1,60 @@
+import gzip
+import io
+import json
+from datetime import datetime
+
+from exporter import encode, export_chunks
+from importer import read_rows
+
+COLUMNS = ['id', 'name', 'genres', 'start_time']
+ROWS = [
+    {'id': 1, 'name': 'The Musical Hop', 'genres': ['Jazz', 'Folk'], 'start_time': datetime(2024, 5, 21, 21, 30)},
+    {'id': 2, 'name': 'Says "hi", then leaves', 'genres': [], 'start_time': None},
+]
+
+
+def text(chunks):
+    return b''.join(chunks).decode('utf-8')
+
+
+def test_csv_reads_back_with_the_importer():
+    exported = text(export_chunks(COLUMNS, iter(ROWS), 'csv'))
+    rows = [row for _, row in read_rows(io.StringIO(exported), 'csv')]
+    assert rows[0] == {'id': '1', 'name': 'The Musical Hop', 'genres': 'Jazz, Folk',
+                       'start_time': '2024-05-21 21:30:00'}
+    assert rows[1]['name'] == 'Says "hi", then leaves'
+
+
+def test_ndjson_reads_back_with_the_importer():
+    exported = text(export_chunks(COLUMNS, iter(ROWS), 'ndjson'))
+    rows = [row for _, row in read_rows(io.StringIO(exported), 'ndjson')]
+    assert rows[0]['genres'] == ['Jazz', 'Folk']
+    assert rows[0]['start_time'] == '2024-05-21 21:30:00'
+    assert rows[1]['start_time'] is None
+
+
+def test_empty_csv_export_has_the_header():
+    assert text(export_chunks(COLUMNS, iter([]), 'csv')) == 'id,name,genres,start_time\r\n'
+
+
+def test_gzip_output_decompresses_to_the_plain_export():
+    plain = b''.join(export_chunks(COLUMNS, iter(ROWS * 500), 'ndjson'))
+    compressed = b''.join(export_chunks(COLUMNS, iter(ROWS * 500), 'ndjson', compress=True))
+    assert gzip.decompress(compressed) == plain
+    assert len(compressed) < len(plain)
+
+
+def test_chunks_are_bounded_and_rows_read_lazily():
+    read = []
+
+    def rows():
+        for i in range(1000):
+            read.append(i)
+            yield {'id': i}
+
+    chunks = encode((json.dumps(row) + '\n' for row in rows()), chunk_size=1024)
+    first = next(chunks)
+    assert 1024 <= len(first) < 1024 + 32
+    assert len(read) < 1000
+    assert sum(len(chunk) for chunk in chunks) + len(first) == \
+        sum(len(json.dumps({'id': i})) + 1 for i in range(1000))
@@ -0,0 +1,113 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from metrics import Registry
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+WORKER = """
+import sys
+from metrics import Registry
+registry = Registry(sys.argv[1])
+registry.counter('requests_total', 'Requests.', ('endpoint',))
+registry.inc('requests_total', ('index',), int(sys.argv[2]))
+"""
+
+
+def run_worker(directory, count):
+    # A worker process that counts and exits, flushing at exit.
+    subprocess.run([sys.executable, '-c', WORKER, str(directory), str(count)], cwd=HERE, check=True)
+
+
+def registry(directory=None):
+    registry = Registry(str(directory) if directory else None)
+    registry.counter('requests_total', 'Requests.', ('endpoint',))
+    registry.histogram('duration_seconds', 'Durations.', ('endpoint',), buckets=(0.1, 1.0))
+    return registry
+
+
+def total(registry):
+    return registry.collect()['requests_total'].get(('index',), 0)
+
+
+def test_render_without_a_directory():
+    metrics = registry()
+    metrics.inc('requests_total', ('index',))
+    metrics.inc('requests_total', ('index',), 2)
+    metrics.observe('duration_seconds', ('index',), 0.05)
+    metrics.observe('duration_seconds', ('index',), 0.5)
+    metrics.observe('duration_seconds', ('index',), 5)
+    assert metrics.render().splitlines() == [
+        '# HELP duration_seconds Durations.',
+        '# TYPE duration_seconds histogram',
+        'duration_seconds_bucket{endpoint="index",le="0.1"} 1',
+        'duration_seconds_bucket{endpoint="index",le="1.0"} 2',
+        'duration_seconds_bucket{endpoint="index",le="+Inf"} 3',
+        'duration_seconds_sum{endpoint="index"} 5.55',
+        'duration_seconds_count{endpoint="index"} 3',
+        '# HELP requests_total Requests.',
+        '# TYPE requests_total counter',
+        'requests_total{endpoint="index"} 3',
+    ]
+
+
+def test_label_values_are_escaped():
+    metrics = registry()
+    metrics.inc('requests_total', ('say "hi"\n',))
+    assert 'requests_total{endpoint="say \\"hi\\"\\n"} 1' in metrics.render()
+
+
+def test_files_are_named_by_pid_and_start_time(tmp_path):
+    metrics = registry(tmp_path)
+    metrics.flush(force=True)
+    (name,) = os.listdir(tmp_path)
+    _, pid, started = name[:-len('.json')].split('-')
+    assert int(pid) == os.getpid() and int(started) > 0
+
+
+def test_live_workers_are_summed(tmp_path):
+    metrics = registry(tmp_path)
+    metrics.inc('requests_total', ('index',), 1)
+    # Another live process; our own pid stands in for it.
+    (tmp_path / f'metrics-{os.getpid()}-1.json').write_text(
+        json.dumps({'requests_total': [[['index'], 100]]}))
+    assert total(metrics) == 101
+    assert total(metrics) == 101
+
+
+@pytest.mark.skipif(sys.platform == 'win32', reason='dead workers are archived with fcntl')
+def test_dead_workers_are_archived_and_counters_never_drop(tmp_path):
+    metrics = registry(tmp_path)
+    metrics.inc('requests_total', ('index',), 1)
+
+    run_worker(tmp_path, 10)
+    assert total(metrics) == 11
+    assert [name for name in os.listdir(tmp_path) if name.endswith('.json')] == ['metrics-archive.json']
+    archive = json.loads((tmp_path / 'metrics-archive.json').read_text())
+    assert archive['metrics']['requests_total'] == [[['index'], 10]]
+
+    run_worker(tmp_path, 5)
+    assert total(metrics) == 16
+    metrics.inc('requests_total', ('index',), 1)
+    assert total(metrics) == 17
+    assert total(metrics) == 17
+
+
+@pytest.mark.skipif(sys.platform == 'win32', reason='dead workers are archived with fcntl')
+def test_archived_files_left_behind_are_not_counted_twice(tmp_path):
+    metrics = registry(tmp_path)
+    run_worker(tmp_path, 10)
+    assert total(metrics) == 10
+    archive = json.loads((tmp_path / 'metrics-archive.json').read_text())
+
+    # As if deleting the file had failed after the archive was written.
+    (tmp_path / 'metrics-999999-1.json').write_text(json.dumps({'requests_total': [[['index'], 10]]}))
+    archive['files'].append('metrics-999999-1.json')
+    archive['metrics']['requests_total'] = [[['index'], 20]]
+    (tmp_path / 'metrics-archive.json').write_text(json.dumps(archive))
+    assert total(metrics) == 20
+    assert total(metrics) == 20
@@ -0,0 +1,130 @@
+import base64
+import json
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import Column, DateTime, Integer, String, create_engine
+from sqlalchemy.orm import Session, declarative_base
+
+from pagination import (InvalidCursor, SortKey, decode_cursor, encode_cursor,
+                        paginate, paginate_ids)
+
+Base = declarative_base()
+
+
+class Place(Base):
+    __tablename__ = 'place'
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String)
+    created_at = Column(DateTime, nullable=False)
+
+
+BY_NAME = [SortKey('name', Place.name, False), SortKey('id', Place.id, False)]
+NEWEST = [SortKey('created_at', Place.created_at, True), SortKey('id', Place.id, True)]
+
+
+def forged(payload):
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip('=')
+
+
+@pytest.fixture
+def session():
+    engine = create_engine('sqlite://')
+    Base.metadata.create_all(engine)
+    with Session(engine) as session:
+        started = datetime(2024, 1, 1)
+        names = ['Cellar', None, 'Attic', 'Barn', None, 'Attic', 'Dome', None, 'Barn']
+        session.add_all(Place(id=i, name=name, created_at=started + timedelta(days=i % 4))
+                        for i, name in enumerate(names, 1))
+        session.commit()
+        yield session
+
+
+def walk(session, keys, per_page):
+    # The ids of every page, following next cursors and then prev cursors
+    # back from the last page.
+    query = session.query(Place.id, Place.name, Place.created_at)
+    pages, cursor = [], None
+    while True:
+        page = paginate(query, keys, cursor, per_page)
+        pages.append([row.id for row in page])
+        if page.next_cursor is None:
+            break
+        cursor = page.next_cursor
+    back = [pages[-1]]
+    while page.prev_cursor is not None:
+        page = paginate(query, keys, page.prev_cursor, per_page)
+        back.append([row.id for row in page])
+    return pages, back[::-1]
+
+
+def test_cursor_round_trip():
+    values = ['Attic', 3, datetime(2024, 1, 2, 12, 30), None]
+    keys = [SortKey('name', Place.name, False), SortKey('id', Place.id, False),
+            SortKey('created_at', Place.created_at, True), SortKey('name', Place.name, False)]
+    assert decode_cursor(encode_cursor(values, backwards=True), keys) == (values, True)
+
+
+@pytest.mark.parametrize('cursor', [
+    'not base64!',
+    forged([[1], [2]]),
+    forged([None, None]),
+    forged([False, 5]),
+    forged([False, {'a': 1}]),
+    forged([False, [[1], [2]]]),
+    forged([False, ['Attic']]),
+    forged([False, ['Attic', 1, 2]]),
+    forged([False, ['Attic', 'one']]),
+    forged([False, ['Attic', True]]),
+    forged([False, ['Attic', None]]),
+    forged([False, [{'dt': 5}, 1]]),
+])
+def test_tampered_cursors_are_invalid(cursor):
+    with pytest.raises(InvalidCursor):
+        decode_cursor(cursor, BY_NAME)
+
+
+def test_tampered_datetime_is_invalid():
+    with pytest.raises(InvalidCursor):
+        decode_cursor(forged([False, ['2024-01-01', 1]]), NEWEST)
+
+
+def test_pages_cover_every_row_once_despite_nulls(session):
+    pages, back = walk(session, BY_NAME, 2)
+    ids = [id for page in pages for id in page]
+    assert ids == [3, 6, 4, 9, 1, 7, 2, 5, 8]
+    assert back == pages
+
+
+def test_descending_pages(session):
+    pages, back = walk(session, NEWEST, 4)
+    ids = [id for page in pages for id in page]
+    assert sorted(ids) == list(range(1, 10))
+    assert ids[0] == 7
+    assert back == pages
+
+
+def test_first_page_has_no_prev_cursor(session):
+    page = paginate(session.query(Place.id, Place.name), BY_NAME, None, 3)
+    assert page.prev_cursor is None
+    assert page.next_cursor is not None
+
+
+def test_paginate_ids():
+    ids = list(range(1, 24, 2))
+    first = paginate_ids(ids, None, 5)
+    assert first.items == [1, 3, 5, 7, 9] and first.prev_cursor is None
+    second = paginate_ids(ids, first.next_cursor, 5)
+    assert second.items == [11, 13, 15, 17, 19]
+    last = paginate_ids(ids, second.next_cursor, 5)
+    assert last.items == [21, 23] and last.next_cursor is None
+    assert paginate_ids(ids, last.prev_cursor, 5).items == second.items
+    assert paginate_ids(ids, second.prev_cursor, 5).items == first.items
+
+
+def test_paginate_ids_rejects_other_cursors():
+    with pytest.raises(InvalidCursor):
+        paginate_ids([1, 2, 3], encode_cursor(['Attic', 1]), 2)
+    with pytest.raises(InvalidCursor):
+        paginate_ids([1, 2, 3], forged([False, ['1']]), 2)
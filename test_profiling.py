@@ -0,0 +1,63 @@
+import os
+import sys
+import time
+
+import pytest
+from flask import Flask
+
+from profiling import CATEGORIES, RequestProfiler, category
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = Flask(__name__)
+    app.config.update(PROFILE_TOKEN='s3cret', PROFILE_ALLOWLIST=['10.0.0.7'],
+                      PROFILE_DIR=str(tmp_path), PROFILE_INTERVAL_MS=1)
+    RequestProfiler(app)
+
+    @app.route('/busy')
+    def busy():
+        deadline = time.perf_counter() + 0.05
+        while time.perf_counter() < deadline:
+            pass
+        return 'done'
+
+    return app
+
+
+def test_unprofiled_requests_are_left_alone(app, tmp_path):
+    response = app.test_client().get('/busy')
+    assert 'X-Profile-File' not in response.headers
+    assert os.listdir(tmp_path) == []
+
+
+def test_wrong_token_is_refused(app, tmp_path):
+    response = app.test_client().get('/busy', headers={'X-Profile': 'guess'})
+    assert 'X-Profile-File' not in response.headers
+
+
+def test_token_profiles_the_request(app, tmp_path):
+    response = app.test_client().get('/busy?profile=s3cret')
+    name = response.headers['X-Profile-File']
+    assert name.endswith('-busy.folded')
+
+    lines = (tmp_path / name).read_text().splitlines()
+    assert lines
+    for line in lines:
+        stack, count = line.rsplit(' ', 1)
+        assert stack.split(';')[0] in CATEGORIES
+        assert int(count) > 0
+    assert any('busy (test_profiling.py' in line for line in lines)
+
+    summary = response.headers['X-Profile-Summary']
+    assert [part.split('=')[0] for part in summary.split('; ')] == list(CATEGORIES)
+
+
+def test_allowlisted_address_needs_no_token(app):
+    response = app.test_client().get('/busy', headers={'X-Profile': '1'},
+                                      environ_base={'REMOTE_ADDR': '10.0.0.7'})
+    assert 'X-Profile-File' in response.headers
+
+
+def test_category_of_plain_code_is_app():
+    assert category(sys._getframe()) == 'app'
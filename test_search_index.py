@@ -0,0 +1,97 @@
+import pytest
+
+from search_index import MAGIC, InvertedIndex, tokenize
+
+
+def build(documents):
+    index = InvertedIndex()
+    for kind, doc_id, text in documents:
+        index.add(kind, doc_id, tokenize(text))
+    return index
+
+
+@pytest.fixture
+def snapshot(tmp_path):
+    path = str(tmp_path / 'search.idx')
+    build([
+        ('Venue', 1, 'The Musical Hop San Francisco'),
+        ('Venue', 2, 'Park Square Live Music & Coffee'),
+        ('Venue', 3, 'The Dueling Pianos Bar New York'),
+        ('Artist', 7, 'Guns N Petals'),
+        ('Artist', 8, 'The Wild Sax Band'),
+    ]).save(path)
+    index = InvertedIndex.load(path)
+    yield index
+    index.close()
+
+
+def test_snapshot_starts_with_magic(tmp_path):
+    path = tmp_path / 'search.idx'
+    build([('Venue', 1, 'hall')]).save(str(path))
+    assert path.read_bytes().startswith(MAGIC)
+
+
+def test_load_rejects_other_files(tmp_path):
+    path = tmp_path / 'search.idx'
+    path.write_bytes(b'not an index')
+    with pytest.raises(ValueError):
+        InvertedIndex.load(str(path))
+
+
+def test_snapshot_round_trip(snapshot):
+    assert snapshot.search('Venue', 'mus') == {1, 2}
+    assert snapshot.search('Venue', 'the') == {1, 3}
+    assert snapshot.search('Artist', 'band') == {8}
+    assert snapshot.search('Artist', 'hop') == set()
+
+
+def test_every_word_must_match(snapshot):
+    assert snapshot.search('Venue', 'mus hop') == {1}
+    assert snapshot.search('Venue', 'mus york') == set()
+
+
+def test_empty_term_matches_every_document(snapshot):
+    assert snapshot.search('Venue', '') == {1, 2, 3}
+    assert snapshot.search('Artist', '  ') == {7, 8}
+
+
+def test_overlay_adds_documents(snapshot):
+    snapshot.add('Venue', 4, tokenize('Music Box'))
+    assert snapshot.search('Venue', 'mus') == {1, 2, 4}
+    assert snapshot.all_ids('Venue') == {1, 2, 3, 4}
+
+
+def test_overlay_replaces_edited_documents(snapshot):
+    snapshot.add('Venue', 1, tokenize('The Jazz Cellar'))
+    assert snapshot.search('Venue', 'mus') == {2}
+    assert snapshot.search('Venue', 'jazz') == {1}
+
+
+def test_overlay_removes_documents(snapshot):
+    snapshot.remove('Venue', 2)
+    assert snapshot.search('Venue', 'mus') == {1}
+    assert 2 not in snapshot.all_ids('Venue')
+
+
+def test_save_merges_overlay_into_the_snapshot(snapshot, tmp_path):
+    snapshot.add('Venue', 4, tokenize('Music Box'))
+    snapshot.remove('Venue', 2)
+    path = str(tmp_path / 'merged.idx')
+    snapshot.save(path)
+
+    merged = InvertedIndex.load(path)
+    try:
+        assert merged.search('Venue', 'mus') == {1, 4}
+        assert merged.all_ids('Venue') == {1, 3, 4}
+    finally:
+        merged.close()
+
+
+def test_carry_over_keeps_changes_made_after_the_snapshot(snapshot):
+    previous = build([])
+    previous.add('Venue', 4, tokenize('Music Box'), at=100.0)
+    previous.add('Venue', 5, tokenize('Music Hall'), at=200.0)
+    previous.remove('Venue', 1, at=250.0)
+
+    snapshot.carry_over(previous, since=150.0)
+    assert snapshot.search('Venue', 'mus') == {2, 5}